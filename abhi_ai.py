@@ -1,117 +1,377 @@
 import os
+import re
+import math
+import hashlib
+import threading
+from collections import OrderedDict
 import google.generativeai as genai
 from dotenv import load_dotenv
 import json
-import re
+import ai_schemas
+from ai_schemas import SchemaError, validate
+from json_stream import IncrementalJSONParser, JSONStreamError
+from app_logging import get_logger
+from profiler import timed_phase
+from circuit_breaker import CircuitBreaker
 
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
 
+log = get_logger("ai")
+
+# Token budgets for the variable part of each prompt (instructions are counted too).
+PROMPT_BUDGETS = {
+    "ask_abhi": 1500,
+    "analyze_skill_gap": 3000,
+    "generate_job_alerts": 1200,
+    "generate_resume": 3500,
+    "generate_course_syllabus": 300,
+    "generate_day_content": 300,
+    "generate_assessment": 300,
+    "generate_career_roadmap": 400,
+    "extract_resume_profile": 4000,
+}
+
+# Only these profile columns ever reach a job-alert prompt (never password, email or phone).
+JOB_ALERT_FIELDS = ("skills", "experience_years", "degree", "university", "grad_year", "location", "bio")
+
+RESUME_SUMMARY_TOKENS = 700
+# generate_day_content returns markdown, so failures are recognised by this prefix.
+LESSON_UNAVAILABLE = "AI is temporarily overloaded."
+AI_UNAVAILABLE = "ABHI AI is temporarily unavailable. Please try again shortly."
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def _compact_text(text):
+    lines, seen = [], set()
+    for line in str(text or "").splitlines():
+        line = re.sub(r"[ \t]+", " ", line).strip()
+        if not line or line.lower() in seen:
+            continue
+        seen.add(line.lower())
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def smart_truncate(text, max_tokens):
+    text = _compact_text(text)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = max(max_tokens * CHARS_PER_TOKEN - 5, 0)
+    head_chars = int(max_chars * 0.75)
+    tail_chars = max_chars - head_chars
+
+    head = text[:head_chars]
+    cut = max(head.rfind("\n"), head.rfind(". "))
+    if cut > head_chars * 0.6:
+        head = head[:cut + 1]
+
+    tail = text[len(text) - tail_chars:] if tail_chars else ""
+    cut = tail.find("\n")
+    if 0 <= cut < tail_chars * 0.4:
+        tail = tail[cut + 1:]
+
+    return f"{head.rstrip()}\n[...]\n{tail.lstrip()}" if tail else head.rstrip()
+
+
+_summary_cache = OrderedDict()
+_summary_lock = threading.Lock()
+
+
+def summarize_resume(text, max_tokens=RESUME_SUMMARY_TOKENS):
+    if not text:
+        return ""
+    key = hashlib.sha1(f"{max_tokens}:{text}".encode("utf-8", "ignore")).hexdigest()
+    with _summary_lock:
+        if key in _summary_cache:
+            _summary_cache.move_to_end(key)
+            return _summary_cache[key]
+
+    summary = smart_truncate(text, max_tokens)
+    with _summary_lock:
+        _summary_cache[key] = summary
+        if len(_summary_cache) > 256:
+            _summary_cache.popitem(last=False)
+    return summary
+
+
+def format_resume_profile(profile):
+    # Renders an extracted profile as a few compact lines for downstream prompts.
+    if not profile:
+        return ""
+    lines = []
+    if profile.get("headline"):
+        lines.append(profile["headline"])
+    if profile.get("titles"):
+        lines.append("Titles: " + ", ".join(profile["titles"]))
+    if profile.get("years_experience") is not None:
+        lines.append(f"Experience: {profile['years_experience']:g} years")
+    if profile.get("skills"):
+        lines.append("Skills: " + ", ".join(f"{s['name']} ({s.get('level', 'unknown')})" for s in profile["skills"]))
+    for edu in profile.get("education") or []:
+        details = ", ".join(str(edu[k]) for k in ("institution", "year") if edu.get(k))
+        lines.append(f"Education: {edu['degree']}" + (f" ({details})" if details else ""))
+    return "\n".join(lines)
+
+
+class Prompt(str):
+    # A prompt string that remembers which method built it and its estimated size.
+    method = "unknown"
+    tokens = 0
+
+
+class PromptBuilder:
+    def __init__(self, method, budget=None):
+        self.method = method
+        self.budget = budget or PROMPT_BUDGETS.get(method, 1000)
+        self.parts = []
+
+    def text(self, value):
+        self.parts.append(("text", str(value), None, 0))
+        return self
+
+    def field(self, label, value, weight=1):
+        if value not in (None, ""):
+            self.parts.append(("field", _compact_text(value), label, weight))
+        return self
+
+    def build(self):
+        fixed = sum(estimate_tokens(v) for kind, v, _, _ in self.parts if kind == "text")
+        fields = [(i, p) for i, p in enumerate(self.parts) if p[0] == "field"]
+        allowance = self._allocate(max(self.budget - fixed, 0), fields)
+
+        rendered = []
+        for i, (kind, value, label, _) in enumerate(self.parts):
+            if kind == "text":
+                rendered.append(value)
+            else:
+                rendered.append(f"{label}:\n{smart_truncate(value, allowance[i])}")
+
+        prompt = Prompt("\n".join(rendered))
+        prompt.method = self.method
+        prompt.tokens = estimate_tokens(prompt)
+        return prompt
+
+    @staticmethod
+    def _allocate(budget, fields):
+        # Water-fill: short fields keep everything and hand their unused share to longer ones.
+        allowance = {}
+        pending = sorted(fields, key=lambda f: estimate_tokens(f[1][1]) / max(f[1][3], 1))
+        while pending:
+            total_weight = sum(max(p[3], 1) for _, p in pending)
+            index, part = pending.pop(0)
+            share = budget * max(part[3], 1) // total_weight
+            need = estimate_tokens(part[1])
+            allowance[index] = min(need, share)
+            budget -= allowance[index]
+        return allowance
+
+
 class ABHIAssistant:
     def __init__(self):
         if not api_key:
-            print("[CRITICAL] GOOGLE_API_KEY is missing!")
+            log.critical("GOOGLE_API_KEY is missing")
         
         self.model_name = "gemini-1.5-flash"
         self.model = genai.GenerativeModel(model_name=self.model_name)
+        self.usage = {}
+        self._usage_lock = threading.Lock()
+        # When the API last answered 429; background work backs off for a while after it.
+        self.rate_limited_at = 0.0
+        # Fails calls fast while Gemini is erroring instead of making every user sit through retries.
+        self.breaker = CircuitBreaker("gemini")
         
-        print(f"[SYSTEM] AI Initialized with {self.model_name}")
+        log.info("AI initialized with %s", self.model_name)
 
-    def _get_json_response(self, prompt):
+    def _record_usage(self, method, prompt, response):
+        estimated = estimate_tokens(prompt)
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "prompt_token_count", None) if usage else None
+        prompt_tokens = actual or estimated
+        
+        with self._usage_lock:
+            stats = self.usage.setdefault(method, {"calls": 0, "prompt_tokens": 0, "max_prompt_tokens": 0})
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["max_prompt_tokens"] = max(stats["max_prompt_tokens"], prompt_tokens)
+        log.info(
+            "%s: prompt_tokens=%d", method, prompt_tokens,
+            extra={"method": method, "prompt_tokens": prompt_tokens, "estimated_tokens": estimated, "budget": PROMPT_BUDGETS.get(method)}
+        )
+
+    @timed_phase("ai")
+    def _get_json_response(self, prompt, schema, item_path=None, on_item=None):
         import time
         max_attempts = 3
+        method = getattr(prompt, "method", "json")
         for attempt in range(max_attempts):
+            if not self.breaker.allow():
+                return json.dumps({"error": AI_UNAVAILABLE, "unavailable": True, "retry_after": self.breaker.retry_after()})
             try:
                 full_prompt = f"SYSTEM: You are ABHI AI. You MUST output ONLY valid JSON. No conversational text.\nUSER: {prompt}"
-                response = self.model.generate_content(full_prompt)
-                
-                if not response or not hasattr(response, 'text'):
-                    raise Exception("Empty response from AI")
-                
-                raw_text = response.text.strip()
-                clean_json = raw_text
-                
-                if "```" in clean_json:
-                    match = re.search(r"```(?:json)?\s*([\{\[].*?[\}\]])\s*```", clean_json, re.DOTALL | re.IGNORECASE)
-                    if match: 
-                        clean_json = match.group(1)
-                    else:
-                        start_obj = clean_json.find('{')
-                        start_list = clean_json.find('[')
-                        start = min(start_obj, start_list) if (start_obj != -1 and start_list != -1) else max(start_obj, start_list)
-                        
-                        end_obj = clean_json.rfind('}')
-                        end_list = clean_json.rfind(']')
-                        end = max(end_obj, end_list)
-                        
-                        if start != -1 and end != -1:
-                            clean_json = clean_json[start:end+1]
+                stream = self._stream_json(full_prompt, schema, item_path, method)
+                index = 0
+                while True:
+                    try:
+                        item = next(stream)
+                    except StopIteration as stop:
+                        self.breaker.record_success()
+                        return json.dumps(stop.value)
+                    if on_item:
+                        # Indices restart on a retry so callers can overwrite partial results.
+                        on_item(index, item)
+                    index += 1
                 
-                json.loads(clean_json.strip())
-                return clean_json.strip()
+            except (JSONStreamError, SchemaError) as e:
+                # The model answered, just badly; that says nothing about its availability.
+                self.breaker.record_success()
+                log.warning("Malformed AI output (%s), attempt %d/%d", e, attempt + 1, max_attempts, extra={"method": method})
+                if attempt < max_attempts - 1:
+                    continue
+                return json.dumps({"error": "AI returned malformed data. Please try again."})
                 
             except Exception as e:
                 error_str = str(e)
+                self.breaker.record_failure()
                 if "429" in error_str:
-                    if attempt < max_attempts - 1:
+                    self.rate_limited_at = time.time()
+                    if attempt < max_attempts - 1 and self.breaker.available():
                         wait_time = (attempt + 1) * 5 
-                        print(f"[SYSTEM] Rate limit hit. Retrying in {wait_time}s...")
+                        log.warning("Rate limit hit, retrying in %ds", wait_time, extra={"method": method})
                         time.sleep(wait_time)
                         continue
                     else:
                         return json.dumps({"error": "AI is temporarily busy (Rate Limit). Please wait 60 seconds and try again."})
                 
-                print(f"[ERROR] AI Failed: {error_str}")
+                log.error("AI call failed: %s", error_str, extra={"method": method})
                 return json.dumps({"error": f"AI Error: {error_str}"})
 
-    def analyze_skill_gap(self, resume_text, jd_text):
-        prompt = f"Analyze Resume vs JD. Output JSON: {{'match_score': 0..100, 'skill_scores': {{}}, 'missing_skills': [], 'advice': ''}}"
-        return self._get_json_response(prompt)
+    def _stream_json(self, prompt, schema, item_path=None, method="json"):
+        config = {"response_mime_type": "application/json", "response_schema": schema}
+        response = self.model.generate_content(prompt, generation_config=config, stream=True)
+        
+        parser = IncrementalJSONParser(item_path)
+        received = False
+        for chunk in response:
+            text = chunk.text
+            received = received or bool(text)
+            yield from parser.feed(text)
+        
+        self._record_usage(method, prompt, response)
+        if not received:
+            raise Exception("Empty response from AI")
+        return validate(schema, parser.close())
+
+    def extract_resume_profile(self, resume_text):
+        prompt = (PromptBuilder("extract_resume_profile")
+            .text("Extract a structured candidate profile from the resume: a one-line headline, job titles held, "
+                  "total years of professional experience, every skill with a level "
+                  f"({', '.join(ai_schemas.SKILL_LEVELS)}) and education entries.")
+            .field("RESUME", resume_text)
+            .build())
+        return self._get_json_response(prompt, ai_schemas.RESUME_PROFILE)
+
+    def analyze_skill_gap(self, resume_text, jd_text, resume_profile=None):
+        builder = PromptBuilder("analyze_skill_gap").text(
+            "Analyze Resume vs JD. Give a 0-100 match_score, a 0-100 score per key skill, the missing skills and one line of advice."
+        )
+        if resume_profile:
+            builder.field("CANDIDATE PROFILE", format_resume_profile(resume_profile), weight=3)
+        else:
+            builder.field("RESUME", resume_text, weight=3)
+        prompt = builder.field("JOB DESCRIPTION", jd_text, weight=2).build()
+        data = json.loads(self._get_json_response(prompt, ai_schemas.SKILL_GAP))
+        if isinstance(data.get("skill_scores"), list):
+            # The schema needs fixed keys, but the analyzer page expects a {skill: score} map.
+            data["skill_scores"] = {s["skill"]: s["score"] for s in data["skill_scores"]}
+        return json.dumps(data)
 
     def ask_abhi(self, user_input):
-        prompt = (
-            f"You are ABHI AI, a helpful career assistant. "
-            f"User asked: '{user_input}'. "
-            f"Provide a friendly, useful response. "
-            f"Output as JSON with keys: 'spoken_summary' (short summary) and 'display_content' (detailed markdown)."
+        prompt = (PromptBuilder("ask_abhi")
+            .text("You are ABHI AI, a helpful career assistant. Provide a friendly, useful response. "
+                  "'spoken_summary' is a short summary and 'display_content' is detailed markdown.")
+            .field("USER ASKED", user_input)
+            .build())
+        return self._get_json_response(prompt, ai_schemas.CHAT)
+
+    def generate_resume(self, name, existing_resume, job_desc, resume_profile=None):
+        builder = PromptBuilder("generate_resume").text(
+            f"Architect a professional resume for {name}, optimized for the job description. "
+            "'spoken_summary' is a short summary and 'display_content' is the full resume in markdown."
         )
-        return self._get_json_response(prompt)
+        if resume_profile:
+            # The profile carries the facts; the raw text only needs to supply wording.
+            builder.field("CANDIDATE PROFILE", format_resume_profile(resume_profile), weight=2)
+            builder.field("EXISTING RESUME", summarize_resume(existing_resume), weight=2)
+        else:
+            builder.field("EXISTING RESUME", summarize_resume(existing_resume, PROMPT_BUDGETS["generate_resume"]), weight=3)
+        prompt = builder.field("JOB DESCRIPTION", job_desc, weight=2).build()
+        return self._get_json_response(prompt, ai_schemas.CHAT)
 
-    def generate_job_alerts(self, user_profile):
-        prompt = f"Based on this profile: {user_profile}, generate 3 realistic job alerts. Output ONLY as JSON: {{'jobs': [{{'job_title': '', 'company': '', 'match_score': 0-100, 'reason': '', 'apply_link': ''}}]}}"
-        return self._get_json_response(prompt)
+    def generate_job_alerts(self, user_profile, resume_profile=None):
+        builder = PromptBuilder("generate_job_alerts").text(
+            "Based on this candidate profile, generate 3 realistic job alerts with a 0-100 match_score each."
+        )
+        for field in JOB_ALERT_FIELDS:
+            builder.field(field.replace("_", " ").title(), user_profile.get(field))
+        if resume_profile:
+            builder.field("Resume Profile", format_resume_profile(resume_profile), weight=3)
+        else:
+            builder.field("Resume Summary", summarize_resume(user_profile.get("resume_text")), weight=3)
+        return self._get_json_response(builder.build(), ai_schemas.JOB_ALERTS)
 
     def generate_course_syllabus(self, topic):
-        prompt = f"Generate a week-wise syllabus for {topic}. Output ONLY as JSON: {{'course_title': '', 'description': '', 'weeks': [{{'week_number': 1, 'title': '', 'days': [{{'day_number': 1, 'title': ''}}]}}]}}"
-        return self._get_json_response(prompt)
+        prompt = PromptBuilder("generate_course_syllabus").text("Generate a week-wise syllabus for the topic.").field("TOPIC", topic).build()
+        return self._get_json_response(prompt, ai_schemas.SYLLABUS)
 
+    @timed_phase("ai")
     def generate_day_content(self, topic, day_title):
         import time
-        prompt = f"Write a detailed professional markdown guide for {topic}: {day_title}. Focus on practical examples."
+        prompt = (PromptBuilder("generate_day_content")
+            .text("Write a detailed professional markdown guide. Focus on practical examples.")
+            .field("SUBJECT", f"{topic}: {day_title}")
+            .build())
         for attempt in range(2):
+            if not self.breaker.allow():
+                return f"{LESSON_UNAVAILABLE} Please try again in a minute."
             try:
                 response = self.model.generate_content(prompt)
+                self._record_usage(prompt.method, prompt, response)
+                self.breaker.record_success()
                 return response.text.strip()
             except Exception as e:
-                if "429" in str(e) and attempt == 0:
-                    time.sleep(5)
-                    continue
-                return f"AI is temporarily overloaded. Please try again in a minute. (Error: {str(e)})"
+                self.breaker.record_failure()
+                if "429" in str(e):
+                    self.rate_limited_at = time.time()
+                    if attempt == 0 and self.breaker.available():
+                        time.sleep(5)
+                        continue
+                return f"{LESSON_UNAVAILABLE} Please try again in a minute. (Error: {str(e)})"
 
     def generate_assessment(self, topic, week_number, is_final=False):
-        prompt = f"Generate 5 MCQs for {topic} Week {week_number}. Output ONLY as JSON: {{'questions': [{{'id': 1, 'question': '', 'options': ['', '', '', ''], 'answer': ''}}]}}"
-        return self._get_json_response(prompt)
-
-    def generate_career_roadmap(self, domain):
-        prompt = (
-            f"Generate a minimalist professional roadmap for {domain}. "
-            f"STRICT RULES: "
-            f"1. PHASE Title: Max 3 words. "
-            f"2. WEEK Title: Max 4 words. "
-            f"3. DAY: Max 1 topic per day. "
-            f"4. EXPLANATION: Exactly one short sentence. "
-            f"5. PRACTICE: One short action. "
-            f"JSON: {{'title': '{domain}', 'phases': [{{'phase_num': 1, 'phase_name': '', 'weeks': [{{'week_number': 1, 'week_title': '', 'days': [{{'day_number': 1, 'topics': [{{'topic_name': '', 'explanation': '', 'practice': ''}}]}}]}}]}}]}} "
-            f"RULE: Global day numbering. Output ONLY JSON."
-        )
-        return self._get_json_response(prompt)
+        prompt = (PromptBuilder("generate_assessment")
+            .text(f"Generate 5 MCQs for Week {week_number}, each with 4 options and the correct answer.")
+            .field("TOPIC", topic)
+            .build())
+        return self._get_json_response(prompt, ai_schemas.QUIZ)
+
+    def generate_career_roadmap(self, domain, on_phase=None):
+        prompt = (PromptBuilder("generate_career_roadmap")
+            .text(
+                "Generate a minimalist professional roadmap for the domain. "
+                "STRICT RULES: "
+                "1. PHASE Title: Max 3 words. "
+                "2. WEEK Title: Max 4 words. "
+                "3. DAY: Max 1 topic per day. "
+                "4. EXPLANATION: Exactly one short sentence. "
+                "5. PRACTICE: One short action. "
+                "RULE: Global day numbering. Use the domain as the title."
+            )
+            .field("DOMAIN", domain)
+            .build())
+        return self._get_json_response(prompt, ai_schemas.ROADMAP, "phases", on_phase)
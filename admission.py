@@ -0,0 +1,154 @@
+import os
+import time
+import asyncio
+from collections import deque
+from starlette.responses import JSONResponse
+
+AI_MAX_CONCURRENT = int(os.environ.get("AI_MAX_CONCURRENT", 4))
+AI_MAX_QUEUE = int(os.environ.get("AI_MAX_QUEUE", 8))
+AI_MAX_PER_USER = int(os.environ.get("AI_MAX_PER_USER", 2))
+AI_QUEUE_TIMEOUT = float(os.environ.get("AI_QUEUE_TIMEOUT", 20))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, retry_after, reason):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionLimiter:
+    def __init__(self, name, max_concurrent=AI_MAX_CONCURRENT, max_queue=AI_MAX_QUEUE,
+                 max_per_user=AI_MAX_PER_USER, queue_timeout=AI_QUEUE_TIMEOUT):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters = deque()
+        self._per_user = {}
+        self._avg_service_time = 5.0
+        self.rejected = 0
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        backlog = self.queued + self.active
+        estimate = self._avg_service_time * max(backlog, 1) / max(self.max_concurrent, 1)
+        return max(1, int(estimate + 0.5))
+
+    def _reject(self, status_code, reason):
+        self.rejected += 1
+        raise AdmissionRejected(status_code, self.retry_after(), reason)
+
+    async def acquire(self, user_key):
+        held = self._per_user.get(user_key, 0)
+        if held >= self.max_per_user:
+            self._reject(429, "Too many concurrent AI requests for this user")
+
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self._per_user[user_key] = held + 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject(503, "AI service is at capacity")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._per_user[user_key] = held + 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return
+            waiter.cancel()
+            self._remove_waiter(waiter)
+            self._release_user(user_key)
+            self._reject(503, "Timed out waiting for an AI slot")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(user_key, 0)
+            else:
+                waiter.cancel()
+                self._remove_waiter(waiter)
+                self._release_user(user_key)
+            raise
+
+    def release(self, user_key, elapsed):
+        if elapsed:
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+        self._release_user(user_key)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to the next waiter so `active` never dips.
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def _release_user(self, user_key):
+        held = self._per_user.get(user_key, 0) - 1
+        if held > 0:
+            self._per_user[user_key] = held
+        else:
+            self._per_user.pop(user_key, None)
+
+    def _remove_waiter(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "avg_service_time": round(self._avg_service_time, 2),
+        }
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, limiters):
+        self.app = app
+        self.limiters = limiters
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get(scope.get("path")) if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        user_key = _user_key(scope)
+        try:
+            await limiter.acquire(user_key)
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                {"error": e.reason, "retry_after": e.retry_after},
+                status_code=e.status_code,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(user_key, time.monotonic() - started)
+
+
+def _user_key(scope):
+    session = scope.get("session") or {}
+    user = session.get("user") or {}
+    if user.get("email"):
+        return user["email"]
+    client = scope.get("client")
+    return client[0] if client else "anonymous"
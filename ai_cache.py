@@ -0,0 +1,262 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from json_util import loads
+from abhi_ai import LESSON_UNAVAILABLE
+from circuit_breaker import CLOSED
+from app_logging import get_logger
+from database import (
+    record_topic_request, get_trending_topics, purge_topic_popularity,
+    get_ai_cache, take_ai_cache, has_ai_cache, put_ai_cache, purge_ai_cache
+)
+
+AI_CACHE_TTL_DAYS = float(os.environ.get("AI_CACHE_TTL_DAYS", 30))
+# Older entries are no longer served as fresh but are kept this long as a fallback for outages.
+AI_CACHE_MAX_AGE_DAYS = float(os.environ.get("AI_CACHE_MAX_AGE_DAYS", 180))
+AI_REVALIDATE_INTERVAL = int(os.environ.get("AI_REVALIDATE_INTERVAL", 30))
+AI_REVALIDATE_BATCH = int(os.environ.get("AI_REVALIDATE_BATCH", 5))
+AI_REVALIDATE_MAX_PENDING = int(os.environ.get("AI_REVALIDATE_MAX_PENDING", 200))
+# Failed refreshes wait AI_REVALIDATE_INTERVAL * 2^attempts before the next try and are
+# dropped after this many.
+AI_REVALIDATE_MAX_ATTEMPTS = int(os.environ.get("AI_REVALIDATE_MAX_ATTEMPTS", 5))
+PREWARM_INTERVAL = int(os.environ.get("PREWARM_INTERVAL", 900))
+PREWARM_TOP_N = int(os.environ.get("PREWARM_TOP_N", 5))
+PREWARM_MIN_REQUESTS = int(os.environ.get("PREWARM_MIN_REQUESTS", 3))
+PREWARM_WINDOW_DAYS = int(os.environ.get("PREWARM_WINDOW_DAYS", 7))
+PREWARM_MAX_CALLS = int(os.environ.get("PREWARM_MAX_CALLS", 6))
+# 1-minute load average per CPU above which the worker is not considered idle.
+PREWARM_MAX_LOAD = float(os.environ.get("PREWARM_MAX_LOAD", 0.5))
+# Seconds to stay away from the API after it last answered 429.
+PREWARM_RATE_LIMIT_COOLDOWN = float(os.environ.get("PREWARM_RATE_LIMIT_COOLDOWN", 600))
+
+log = get_logger("ai_cache")
+
+# (kind, key) -> (task returning True once the stored result is fresh again, failed attempts,
+# monotonic time before which it is not retried).
+_pending = OrderedDict()
+_pending_lock = threading.Lock()
+
+
+def topic_key(text):
+    # "Machine Learning", " machine  learning!" and "MACHINE LEARNING" share one key;
+    # + # . survive so C++, C# and Node.js stay distinct.
+    return re.sub(r"[^a-z0-9+#.]+", " ", (text or "").lower()).strip()
+
+
+def lesson_key(topic, day_title):
+    return f"{topic_key(topic)}|{topic_key(day_title)}"
+
+
+def quiz_key(topic, week, is_final=False):
+    return f"{topic_key(topic)}|{week}|{'final' if is_final else 'weekly'}"
+
+
+def _now():
+    return datetime.utcnow()
+
+
+def _fresh_after():
+    return (_now() - timedelta(days=AI_CACHE_TTL_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _kept_after():
+    return (_now() - timedelta(days=AI_CACHE_MAX_AGE_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def record_request(kind, topic):
+    key = topic_key(topic)
+    if key:
+        record_topic_request(kind, key, topic.strip(), _now().strftime("%Y-%m-%d"))
+
+
+def json_ok(content):
+    try:
+        data = loads(content)
+    except ValueError:
+        return False
+    return not (isinstance(data, dict) and "error" in data)
+
+
+def lesson_ok(content):
+    return bool(content) and not content.startswith(LESSON_UNAVAILABLE)
+
+
+def _store(kind, key, content, source, served=False):
+    now = _now().strftime("%Y-%m-%d %H:%M:%S")
+    put_ai_cache(kind, key, content, source, now, now if served else None)
+
+
+def cached_generate(kind, key, generate, valid=json_ok, warm=True):
+    # Returns (content, stale). A result generated ahead of demand (prewarm or revalidation)
+    # is handed to the first request for its topic and never again; everything else is a new
+    # generation. The last good result is kept, but only to be served as stale when
+    # generating fails, e.g. while the AI circuit is open, and is then regenerated in the
+    # background. warm=False (an explicit regenerate) skips the unserved entry.
+    if key and warm:
+        content = take_ai_cache(kind, key, _fresh_after())
+        if content is not None:
+            return content, False
+    content = generate()
+    if not key:
+        return content, False
+    if valid(content):
+        _store(kind, key, content, "request", served=True)
+        return content, False
+
+    stale = get_ai_cache(kind, key, _kept_after())
+    if stale is None:
+        return content, False
+    schedule_revalidation(kind, key, lambda: _regenerate(kind, key, generate, valid))
+    return stale, True
+
+
+def _regenerate(kind, key, generate, valid):
+    content = generate()
+    if not valid(content):
+        return False
+    _store(kind, key, content, "revalidate")
+    return True
+
+
+def schedule_revalidation(kind, key, task, attempts=0, not_before=0.0):
+    with _pending_lock:
+        if (kind, key) not in _pending and len(_pending) < AI_REVALIDATE_MAX_PENDING:
+            _pending[(kind, key)] = (task, attempts, not_before)
+
+
+def _next_due():
+    now = time.monotonic()
+    with _pending_lock:
+        for item, entry in _pending.items():
+            if entry[2] <= now:
+                del _pending[item]
+                return item, entry
+    return None, None
+
+
+def run_revalidation(assistant):
+    # Works through stale results one at a time while the AI circuit lets calls through;
+    # the first call after an outage doubles as the breaker's half-open probe.
+    if not _pending or not assistant.breaker.available():
+        return None
+
+    stats = {"refreshed": 0, "failed": 0, "dropped": 0}
+    for _ in range(AI_REVALIDATE_BATCH):
+        item, entry = _next_due()
+        if item is None:
+            break
+        task, attempts, _ = entry
+        try:
+            ok = task()
+        except Exception:
+            log.exception("Revalidation of %s %s failed", *item)
+            ok = False
+        if ok:
+            stats["refreshed"] += 1
+            continue
+        stats["failed"] += 1
+        if not assistant.breaker.available():
+            # The AI went down again; that says nothing about this key, so it keeps its attempts.
+            schedule_revalidation(*item, task, attempts)
+            break
+        attempts += 1
+        if attempts >= AI_REVALIDATE_MAX_ATTEMPTS:
+            stats["dropped"] += 1
+            log.warning("Gave up revalidating %s %s after %d attempts", *item, attempts)
+            continue
+        schedule_revalidation(*item, task, attempts, time.monotonic() + AI_REVALIDATE_INTERVAL * 2 ** attempts)
+
+    if not stats["refreshed"] and not stats["failed"]:
+        return None
+    with _pending_lock:
+        stats["pending"] = len(_pending)
+    stats["processed"] = stats["refreshed"]
+    return stats
+
+
+def is_idle(assistant, limiters):
+    if any(limiter.active or limiter.queued for limiter in limiters):
+        return False
+    if assistant.breaker.state != CLOSED:
+        return False
+    if time.time() - assistant.rate_limited_at < PREWARM_RATE_LIMIT_COOLDOWN:
+        return False
+    if hasattr(os, "getloadavg"):
+        if os.getloadavg()[0] / (os.cpu_count() or 1) > PREWARM_MAX_LOAD:
+            return False
+    return True
+
+
+def _week_one(syllabus_json):
+    weeks = loads(syllabus_json).get("weeks") or []
+    if not weeks:
+        return None, []
+    week = weeks[0].get("week_number") or 1
+    return week, [day.get("title") for day in weeks[0].get("days") or [] if day.get("title")]
+
+
+def _prewarm_tasks(assistant, courses, domains):
+    # Syllabi and roadmaps first (they are what the first user waits on), then each course's
+    # week-1 lessons and quiz. Later tasks are built lazily because they need the syllabus.
+    for row in courses:
+        topic = row["topic"]
+        yield "syllabus", row["topic_key"], lambda topic=topic: assistant.generate_course_syllabus(topic), json_ok
+    for row in domains:
+        domain = row["topic"]
+        yield "roadmap", row["topic_key"], lambda domain=domain: assistant.generate_career_roadmap(domain), json_ok
+
+    fresh_after = _fresh_after()
+    for row in courses:
+        topic = row["topic"]
+        syllabus = get_ai_cache("syllabus", row["topic_key"], fresh_after, count_hit=False)
+        if not syllabus:
+            continue
+        week, titles = _week_one(syllabus)
+        for title in titles:
+            yield "lesson", lesson_key(topic, title), lambda title=title, topic=topic: assistant.generate_day_content(topic, title), lesson_ok
+        if week is not None:
+            yield "quiz", quiz_key(topic, week), lambda week=week, topic=topic: assistant.generate_assessment(topic, week), json_ok
+
+
+def run_prewarm(assistant, limiters):
+    # Generates content for trending topics ahead of demand, one AI call at a time, only while
+    # the AI endpoints are idle, the API is not rate limiting and the machine is not busy.
+    if not is_idle(assistant, limiters):
+        return None
+
+    since = (_now() - timedelta(days=PREWARM_WINDOW_DAYS)).strftime("%Y-%m-%d")
+    courses = get_trending_topics("course", since, PREWARM_MIN_REQUESTS, PREWARM_TOP_N)
+    domains = get_trending_topics("roadmap", since, PREWARM_MIN_REQUESTS, PREWARM_TOP_N)
+    purge_topic_popularity(since)
+    purge_ai_cache(_kept_after())
+    if not courses and not domains:
+        return None
+
+    stats = {"topics": len(courses) + len(domains), "generated": 0, "failed": 0, "cached": 0, "stopped": None}
+    fresh_after = _fresh_after()
+    for kind, key, generate, valid in _prewarm_tasks(assistant, courses, domains):
+        if has_ai_cache(kind, key, fresh_after):
+            stats["cached"] += 1
+            continue
+        if stats["generated"] + stats["failed"] >= PREWARM_MAX_CALLS:
+            stats["stopped"] = "budget"
+            break
+        if not is_idle(assistant, limiters):
+            stats["stopped"] = "busy"
+            break
+
+        content = generate()
+        if valid(content):
+            _store(kind, key, content, "prewarm")
+            stats["generated"] += 1
+        else:
+            stats["failed"] += 1
+            log.warning("Prewarm of %s %s failed", kind, key)
+
+    if not stats["generated"] and not stats["failed"]:
+        return None
+    stats["processed"] = stats["generated"]
+    return stats
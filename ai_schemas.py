@@ -0,0 +1,140 @@
+def _obj(properties, required=None):
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties) if required is None else required
+    }
+
+
+def _arr(items):
+    return {"type": "array", "items": items}
+
+
+STRING = {"type": "string"}
+INTEGER = {"type": "integer"}
+NUMBER = {"type": "number"}
+
+CHAT = _obj({
+    "spoken_summary": STRING,
+    "display_content": STRING
+})
+
+SKILL_GAP = _obj({
+    "match_score": INTEGER,
+    "skill_scores": _arr(_obj({"skill": STRING, "score": INTEGER})),
+    "missing_skills": _arr(STRING),
+    "advice": STRING
+})
+
+SKILL_LEVELS = ["beginner", "intermediate", "advanced", "expert"]
+
+RESUME_PROFILE = _obj({
+    "headline": STRING,
+    "titles": _arr(STRING),
+    "years_experience": NUMBER,
+    "skills": _arr(_obj({
+        "name": STRING,
+        "level": {"type": "string", "format": "enum", "enum": SKILL_LEVELS}
+    })),
+    "education": _arr(_obj({
+        "degree": STRING,
+        "institution": STRING,
+        "year": STRING
+    }, required=["degree"]))
+}, required=["titles", "years_experience", "skills", "education"])
+
+JOB_ALERTS = _obj({
+    "jobs": _arr(_obj({
+        "job_title": STRING,
+        "company": STRING,
+        "match_score": INTEGER,
+        "reason": STRING,
+        "apply_link": STRING
+    }))
+})
+
+SYLLABUS = _obj({
+    "course_title": STRING,
+    "description": STRING,
+    "weeks": _arr(_obj({
+        "week_number": INTEGER,
+        "title": STRING,
+        "days": _arr(_obj({"day_number": INTEGER, "title": STRING}))
+    }))
+})
+
+QUIZ = _obj({
+    "questions": _arr(_obj({
+        "id": INTEGER,
+        "question": STRING,
+        "options": _arr(STRING),
+        "answer": STRING
+    }))
+})
+
+ROADMAP = _obj({
+    "title": STRING,
+    "estimated_duration": STRING,
+    "phases": _arr(_obj({
+        "phase_num": INTEGER,
+        "phase_name": STRING,
+        "weeks": _arr(_obj({
+            "week_number": INTEGER,
+            "week_title": STRING,
+            "days": _arr(_obj({
+                "day_number": INTEGER,
+                "topics": _arr(_obj({
+                    "topic_name": STRING,
+                    "explanation": STRING,
+                    "practice": STRING
+                }))
+            }))
+        }))
+    }))
+}, required=["title", "phases"])
+
+
+class SchemaError(ValueError):
+    pass
+
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+}
+
+
+def validate(schema, value, path="$"):
+    expected = schema.get("type")
+
+    if expected in ("integer", "number"):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise SchemaError(f"{path}: expected {expected}, got {type(value).__name__}")
+        if expected == "integer" and isinstance(value, float):
+            if not value.is_integer():
+                raise SchemaError(f"{path}: expected integer, got {value}")
+            value = int(value)
+        return value
+
+    if expected in _TYPES and not isinstance(value, _TYPES[expected]):
+        raise SchemaError(f"{path}: expected {expected}, got {type(value).__name__}")
+
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                raise SchemaError(f"{path}: missing '{key}'")
+        properties = schema.get("properties", {})
+        return {
+            key: validate(properties[key], item, f"{path}.{key}") if key in properties else item
+            for key, item in value.items()
+        }
+
+    if expected == "array":
+        items = schema.get("items")
+        if not items:
+            return value
+        return [validate(items, item, f"{path}[{i}]") for i, item in enumerate(value)]
+
+    return value
@@ -0,0 +1,172 @@
+import os
+import re
+import contextvars
+import json
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from abhi_ai import JOB_ALERT_FIELDS, summarize_resume
+from json_util import loads
+from database import get_alert_refresh_candidates, add_notifications
+from app_logging import get_logger
+
+log = get_logger("alerts")
+
+ALERT_REFRESH_INTERVAL = int(os.environ.get("ALERT_REFRESH_INTERVAL", 1800))
+ALERT_REFRESH_WINDOW = os.environ.get("ALERT_REFRESH_WINDOW", "1-5")
+ALERT_REFRESH_MIN_AGE_HOURS = float(os.environ.get("ALERT_REFRESH_MIN_AGE_HOURS", 24))
+ALERT_REFRESH_MAX_USERS = int(os.environ.get("ALERT_REFRESH_MAX_USERS", 2000))
+ALERT_REFRESH_CONCURRENCY = int(os.environ.get("ALERT_REFRESH_CONCURRENCY", 2))
+ALERT_REFRESH_QUOTA = int(os.environ.get("ALERT_REFRESH_QUOTA", 50))
+ALERT_CLUSTER_SIMILARITY = float(os.environ.get("ALERT_CLUSTER_SIMILARITY", 0.7))
+
+WRITE_BATCH = 500
+
+
+def in_window(now=None, window=ALERT_REFRESH_WINDOW):
+    # "start-end" in UTC hours; a window such as "22-4" wraps past midnight.
+    start, end = (int(part) for part in window.split("-"))
+    hour = (now or datetime.utcnow()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def jaccard(a, b):
+    # No skills on either side says nothing about how alike two users are.
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _experience_band(row, profile):
+    years = profile.get("years_experience") if profile else None
+    if years is None:
+        match = re.search(r"\d+(\.\d+)?", str(row["experience_years"] or ""))
+        years = float(match.group()) if match else None
+    if years is None:
+        return "unknown"
+    return "junior" if years < 2 else "mid" if years < 5 else "senior"
+
+
+def _candidate(row):
+    profile = loads(row["profile_json"]) if row["profile_json"] else None
+    skills = {s.strip().lower() for s in re.split(r"[,;/\n]", row["skills"] or "") if s.strip()}
+    if profile:
+        skills |= {s["name"].strip().lower() for s in profile.get("skills", []) if s.get("name")}
+    fields = {field: row[field] for field in JOB_ALERT_FIELDS}
+    if not profile and row["resume_text"]:
+        fields["resume_text"] = summarize_resume(row["resume_text"])
+    return {
+        "email": row["email"],
+        "fields": fields,
+        "resume_profile": profile,
+        "skill_set": frozenset(skills),
+        "band": _experience_band(row, profile),
+        # A resume without an extracted profile is not reflected in skill_set, so its alerts
+        # are generated for that user alone.
+        "solo": "resume_text" in fields,
+    }
+
+
+def cluster_users(users, threshold=ALERT_CLUSTER_SIMILARITY):
+    # Greedy leader clustering: the broadest profiles lead, and everyone else joins the first
+    # leader in the same experience band whose skills are similar enough.
+    clusters = []
+    for user in sorted(users, key=lambda u: -len(u["skill_set"])):
+        for cluster in clusters:
+            leader = cluster["leader"]
+            if user["solo"] or leader["solo"]:
+                continue
+            if leader["band"] == user["band"] and jaccard(leader["skill_set"], user["skill_set"]) >= threshold:
+                cluster["members"].append(user)
+                break
+        else:
+            clusters.append({"leader": user, "members": [user]})
+    return clusters
+
+
+def _generate(assistant, leader):
+    try:
+        data = json.loads(assistant.generate_job_alerts(leader["fields"], resume_profile=leader["resume_profile"]))
+    except Exception as e:
+        log.error("Generation failed for cluster leader: %s", e)
+        return None
+    if "error" in data:
+        log.warning("Generation failed for cluster leader: %s", data['error'])
+        return None
+    return [job for job in data.get("jobs", []) if isinstance(job, dict)]
+
+
+def _member_rows(cluster, jobs):
+    leader = cluster["leader"]
+    rows = []
+    for member in cluster["members"]:
+        similarity = jaccard(leader["skill_set"], member["skill_set"])
+        for job in jobs:
+            rows.append((
+                member["email"],
+                job.get("job_title", "Unknown Role"),
+                job.get("company", "Unknown Company"),
+                round((job.get("match_score") or 0) * similarity),
+                job.get("reason", "Profile Match"),
+                job.get("apply_link", "#"),
+            ))
+    return rows
+
+
+def refresh_job_alerts(assistant, now=None):
+    if not in_window(now):
+        return None
+
+    start = time.perf_counter()
+    stale_before = ((now or datetime.utcnow()) - timedelta(hours=ALERT_REFRESH_MIN_AGE_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+    users = [_candidate(row) for row in get_alert_refresh_candidates(stale_before, ALERT_REFRESH_MAX_USERS)]
+    if not users:
+        return None
+
+    # Biggest clusters first so the generation quota covers as many users as possible;
+    # whoever is left over stays stale and is picked up by the next run.
+    clusters = sorted(cluster_users(users), key=lambda c: -len(c["members"]))
+    scheduled = clusters[:ALERT_REFRESH_QUOTA]
+
+    stats = {
+        "users": len(users),
+        "clusters": len(clusters),
+        "generated": 0,
+        "failed": 0,
+        "refreshed_users": 0,
+        "deferred_users": sum(len(c["members"]) for c in clusters[ALERT_REFRESH_QUOTA:]),
+        "notifications": 0,
+    }
+
+    pending = []
+
+    def flush():
+        if pending and add_notifications(pending):
+            stats["notifications"] += len(pending)
+        pending.clear()
+
+    with ThreadPoolExecutor(max_workers=max(ALERT_REFRESH_CONCURRENCY, 1)) as pool:
+        # Workers run in a copy of this job's context so their logs carry its correlation id.
+        futures = {pool.submit(contextvars.copy_context().run, _generate, assistant, c["leader"]): c for c in scheduled}
+        for done, future in enumerate(as_completed(futures), 1):
+            cluster = futures[future]
+            jobs = future.result()
+            if jobs is None:
+                stats["failed"] += 1
+                continue
+
+            stats["generated"] += 1
+            stats["refreshed_users"] += len(cluster["members"])
+            pending.extend(_member_rows(cluster, jobs))
+            if len(pending) >= WRITE_BATCH:
+                flush()
+            if done % 10 == 0:
+                log.info("Refresh progress: %d/%d clusters, %d users", done, len(scheduled), stats['refreshed_users'])
+        flush()
+
+    elapsed = time.perf_counter() - start
+    stats["processed"] = stats["refreshed_users"]
+    stats["users_per_second"] = round(stats["refreshed_users"] / elapsed, 2) if elapsed else None
+    return stats
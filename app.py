@@ -1,32 +1,77 @@
 import random
+import asyncio
 import uvicorn
 import json
 import re
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import PyPDF2
 import shutil
+from datetime import datetime
 from fastapi import FastAPI, Request, Form, Body, File, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, PlainTextResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, PlainTextResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from abhi_ai import ABHIAssistant
-from database import init_db, add_user, get_user, get_user_profile, update_user_profile, add_notification, get_notifications, mark_notifications_read, migrate_notifications_schema, migrate_users_schema, add_resume, get_user_resumes, delete_resume, set_active_resume, get_active_resume_text, create_course, get_user_courses, get_course_details, save_day_content, get_day_content, update_course_progress, save_roadmap, get_user_roadmap, delete_roadmap
+from admission import AdmissionLimiter, AdmissionMiddleware
+from app_logging import setup_logging, get_logger, RequestIdMiddleware
+from profiler import ProfilerMiddleware, ProfiledTemplates, profiles, get_profile, is_admin
+from resume_profiles import ensure_resume_profile
+from jobs import PeriodicJob
+from retention import run_retention, NOTIFY_RETENTION_INTERVAL
+from alert_refresh import refresh_job_alerts, ALERT_REFRESH_INTERVAL
+from digest import send_digests, DIGEST_INTERVAL, SMTP_HOST
+from data_export import export_ndjson, export_zip
+from ai_cache import record_request, cached_generate, topic_key, lesson_key, quiz_key, lesson_ok, run_prewarm, PREWARM_INTERVAL, schedule_revalidation, run_revalidation, AI_REVALIDATE_INTERVAL
+from lesson_render import is_current
+from json_util import FastJSONResponse, RawJSONResponse, dumps, loads, splice_object, splice_array
+from database import init_db, add_user, get_user, get_user_profile, update_user_profile, add_notification, get_notifications, mark_notifications_read, mark_notification_read, migrate_notifications_schema, migrate_users_schema, add_resume, get_user_resumes, get_profile_page_data, delete_resume, set_active_resume, get_active_resume_text, get_active_resume, get_resume_profile, create_course, list_user_courses, get_course_details, save_day_content, get_rendered_day_content, get_day_content_hash, mark_course_day, unlock_course_week, get_completed_days, get_course_day_keys, save_roadmap, get_user_roadmap, delete_roadmap, get_roadmap_weeks, update_roadmap_day, set_roadmap_day_completed, get_roadmap_completed_days, search_documents, get_ai_cache_stats
+
+setup_logging()
+log = get_logger("app")
 
 init_db()
 
 app = FastAPI()
 
+ai_limiters = {
+    "/ask": AdmissionLimiter("ask"),
+    "/analyze-gap": AdmissionLimiter("analyze-gap"),
+    "/generate-resume": AdmissionLimiter("generate-resume"),
+    "/api/career/roadmap/generate": AdmissionLimiter("roadmap-generate"),
+}
+
+# Added before the session middleware so they run inside it and can see the session user.
+app.add_middleware(AdmissionMiddleware, limiters=ai_limiters)
+app.add_middleware(ProfilerMiddleware)
 app.add_middleware(SessionMiddleware, secret_key="JYOMARG_ULTRA_SECRET")
+# Outermost, so the correlation id covers every other middleware and the access log sees the final status.
+app.add_middleware(RequestIdMiddleware)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates") 
+templates = ProfiledTemplates(directory="templates") 
 
 abhi = ABHIAssistant()
 
+background_jobs = [
+    PeriodicJob("notification-retention", run_retention, NOTIFY_RETENTION_INTERVAL),
+    PeriodicJob("job-alert-refresh", lambda: refresh_job_alerts(abhi), ALERT_REFRESH_INTERVAL),
+    PeriodicJob("email-digest", send_digests, DIGEST_INTERVAL if SMTP_HOST else 0),
+    PeriodicJob("ai-prewarm", lambda: run_prewarm(abhi, ai_limiters.values()), PREWARM_INTERVAL),
+    PeriodicJob("ai-revalidate", lambda: run_revalidation(abhi), AI_REVALIDATE_INTERVAL),
+]
+
+@app.on_event("startup")
+async def start_background_jobs():
+    for job in background_jobs:
+        job.start()
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    for job in background_jobs:
+        job.stop()
+
 @app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
 async def landing_page(request: Request):
     return templates.TemplateResponse("landing.html", {"request": request})
@@ -35,6 +80,48 @@ async def landing_page(request: Request):
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/api/admin/stats")
+async def admin_stats_api(request: Request):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if not is_admin(user): return JSONResponse({"error": "Forbidden"}, status_code=403)
+
+    return JSONResponse({
+        "ai_load": {name: limiter.stats() for name, limiter in ai_limiters.items()},
+        "ai_usage": abhi.usage,
+        "ai_breaker": abhi.breaker.stats(),
+        "jobs": {job.name: job.stats() for job in background_jobs}
+    })
+
+@app.get("/api/admin/profiles")
+async def list_profiles_api(request: Request):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if not is_admin(user): return JSONResponse({"error": "Forbidden"}, status_code=403)
+
+    return JSONResponse([profile.summary() for profile in reversed(profiles)])
+
+@app.get("/api/admin/ai-cache")
+async def ai_cache_stats_api(request: Request):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if not is_admin(user): return JSONResponse({"error": "Forbidden"}, status_code=403)
+
+    return JSONResponse(get_ai_cache_stats())
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile_api(request: Request, profile_id: int, format: str = "json"):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if not is_admin(user): return JSONResponse({"error": "Forbidden"}, status_code=403)
+
+    profile = get_profile(profile_id)
+    if not profile:
+        return JSONResponse({"error": "Profile not found"}, status_code=404)
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed(), headers={"Content-Disposition": f"attachment; filename=profile-{profile_id}.folded"})
+    return JSONResponse({**profile.summary(), "stacks": profile.stacks})
+
 @app.get("/signup", response_class=HTMLResponse)
 async def signup_page(request: Request):
     return templates.TemplateResponse("signup.html", {"request": request})
@@ -67,49 +154,21 @@ async def profile_page(request: Request):
     if not request.session.get("user"): return RedirectResponse(url="/login")
     
     user_email = request.session["user"]["email"]
-    user_data = get_user_profile(user_email)
-    
-    notifications = get_notifications(user_email)
-    
-    if not notifications and user_data:
-        user_profile_dict = dict(user_data) 
-        alerts_json = abhi.generate_job_alerts(user_profile_dict)
-        try:
-            alerts = json.loads(alerts_json)
-            for alert in alerts:
-                add_notification(
-                    user_email, 
-                    alert.get("job_title", "Unknown Role"), 
-                    alert.get("company", "Unknown Company"), 
-                    alert.get("match_score", 0), 
-                    alert.get("reason", "Profile Match"),
-                    alert.get("apply_link", "#")
-                )
-            notifications = get_notifications(user_email)
-        except:
-            pass 
-            
-    resumes = get_user_resumes(user_email)
-    
-    if not resumes and user_data and user_data['resume_path']:
-        try:
-             legacy_path = user_data['resume_path']
-             filename = os.path.basename(legacy_path)
-             if not filename: filename = "Legacy_Resume.pdf"
-             
-             try:
-                legacy_text = user_data['resume_text'] if 'resume_text' in user_data.keys() else ""
-             except:
-                legacy_text = ""
-             
-             add_resume(user_email, filename, legacy_path, legacy_text, is_active=True)
-             
-             resumes = get_user_resumes(user_email)
-             print(f"Migrated legacy resume for {user_email}")
-        except Exception as e:
-            print(f"Migration Error: {e}")
+    user_data, notifications, resumes = await run_in_threadpool(get_profile_page_data, user_email)
+    # Rendered from what is stored; missing alerts and a legacy resume are filled in afterwards
+    # and the page polls /api/profile/sections for them.
+    pending = schedule_profile_fill(user_email, user_data, notifications, resumes)
+
+    return templates.TemplateResponse("profile.html", {"request": request, "user": user_data, "notifications": notifications, "resumes": resumes, "pending": pending})
+
+@app.get("/api/profile/sections")
+async def profile_sections_api(request: Request):
+    user_session = request.session.get("user")
+    if not user_session: return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
-    return templates.TemplateResponse("profile.html", {"request": request, "user": user_data, "notifications": notifications, "resumes": resumes})
+    email = user_session["email"]
+    _, notifications, resumes = await run_in_threadpool(get_profile_page_data, email)
+    return FastJSONResponse({"pending": email in _profile_fills, "notifications": notifications, "resumes": resumes})
 
 @app.post("/api/notifications/search")
 async def trigger_search_custom(request: Request):
@@ -123,37 +182,32 @@ async def trigger_search_custom(request: Request):
         return JSONResponse({"error": "Profile not found"}, status_code=404)
         
     try:
-        active_text = get_active_resume_text(email)
         user_profile_dict = dict(user_data)
-        if active_text:
-             user_profile_dict['resume_text'] = active_text
+        resume_profile = get_resume_profile(email)
+        if not resume_profile:
+            active_text = get_active_resume_text(email)
+            if active_text:
+                user_profile_dict['resume_text'] = active_text
              
-        alerts_raw = abhi.generate_job_alerts(user_profile_dict)
+        alerts_raw = await run_in_threadpool(abhi.generate_job_alerts, user_profile_dict, resume_profile)
         alerts_data = json.loads(alerts_raw)
         
+        if alerts_data.get("unavailable"):
+            # Keep showing the alerts already stored and search again once the AI is back.
+            schedule_revalidation("alerts", email, lambda: run_job_search(email, user_profile_dict, resume_profile))
+            if get_notifications(email):
+                return JSONResponse({"message": "ABHI AI is unavailable right now; showing your saved alerts. New matches will appear shortly.", "stale": True})
+            return _ai_unavailable_response(alerts_data["error"])
         if "error" in alerts_data:
             return JSONResponse({"error": alerts_data["error"]}, status_code=500)
             
-        jobs = alerts_data.get("jobs", [])
-        if not isinstance(jobs, list):
+        if not isinstance(alerts_data.get("jobs", []), list):
             return JSONResponse({"error": "Invalid AI response structure"}, status_code=500)
             
-        count = 0
-        for job in jobs:
-            if isinstance(job, dict):
-                add_notification(
-                    email, 
-                    job.get("job_title", "Unknown Role"), 
-                    job.get("company", "Unknown Company"), 
-                    job.get("match_score", 0), 
-                    job.get("reason", ""), 
-                    job.get("apply_link", "#")
-                )
-                count += 1
-            
+        count = store_job_alerts(email, alerts_data)
         return JSONResponse({"message": f"Search complete. Found {count} new jobs."})
     except Exception as e:
-        print(f"Manual Search Error: {e}")
+        log.exception("Manual search failed")
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.get("/resume")
@@ -182,22 +236,74 @@ async def generate_roadmap_api(request: Request):
     data = await request.json()
     domain = data.get("domain")
     preview = data.get("preview", False) 
-    
-    roadmap_json = abhi.generate_career_roadmap(domain)
-    
-    if preview:
-        try:
-            return JSONResponse(json.loads(roadmap_json))
-        except json.JSONDecodeError:
-            return JSONResponse({"error": f"Invalid AI Response: {roadmap_json[:500]}"}, 500)
-    
+    regenerate = bool(data.get("regenerate"))
+    
+    record_request("roadmap", domain)
+    if data.get("stream"):
+        return StreamingResponse(_stream_roadmap(user["email"], domain, preview, regenerate), media_type="application/x-ndjson")
+    
+    error, roadmap_json, stale = await run_in_threadpool(_generate_roadmap, user["email"], domain, preview, regenerate)
+    if error:
+        return error
+    return _ai_json_response(roadmap_json, stale)
+
+def _generate_roadmap(email, domain, preview, regenerate, on_phase=None):
+    # Returns (error response or None, roadmap json, stale) and saves the roadmap unless previewing.
+    roadmap_json, stale = cached_generate(
+        "roadmap", topic_key(domain), lambda: abhi.generate_career_roadmap(domain, on_phase), warm=not regenerate
+    )
+    # An error must never replace the roadmap the user already has.
+    error = _ai_error_response(roadmap_json)
+    if error is None and not preview and not save_roadmap(email, domain, roadmap_json):
+        error = JSONResponse({"error": f"Failed to save roadmap. AI Response: {roadmap_json[:500]}"}, 500)
+    return error, roadmap_json, stale
+
+async def _stream_roadmap(email, domain, preview, regenerate):
+    # NDJSON: {"index", "phase"} as each phase is generated (a retry starts again at index 0),
+    # then {"done", "stale", "roadmap"} or {"error"}. Saving happens in the worker thread, so a
+    # client that disconnects early still gets its roadmap stored.
+    loop = asyncio.get_running_loop()
+    phases = asyncio.Queue()
+
+    def on_phase(index, phase):
+        loop.call_soon_threadsafe(phases.put_nowait, (index, phase))
+
+    task = asyncio.ensure_future(run_in_threadpool(_generate_roadmap, email, domain, preview, regenerate, on_phase))
+    task.add_done_callback(lambda _: phases.put_nowait(None))
+    while True:
+        item = await phases.get()
+        if item is None:
+            break
+        yield dumps({"index": item[0], "phase": item[1]}) + b"\n"
+
+    error, roadmap_json, stale = task.result()
+    if error:
+        yield error.body + b"\n"
+    else:
+        yield splice_object({"done": True, "stale": stale}, {"roadmap": roadmap_json}) + b"\n"
+
+def _ai_unavailable_response(error):
+    retry_after = abhi.breaker.retry_after()
+    return JSONResponse({"error": error, "retry_after": retry_after}, status_code=503, headers={"Retry-After": str(retry_after)})
+
+def _ai_error_response(raw_json):
+    # None when the AI produced a result; otherwise the response to send instead of storing it.
     try:
-        if save_roadmap(user["email"], domain, roadmap_json):
-            return JSONResponse(json.loads(roadmap_json))
-        else:
-            return JSONResponse({"error": "Failed to save roadmap"}, 500)
-    except json.JSONDecodeError:
-         return JSONResponse({"error": f"Invalid AI Response: {roadmap_json[:500]}"}, 500)
+        data = loads(raw_json)
+    except ValueError:
+        return JSONResponse({"error": "Invalid AI Response"}, 500)
+    if not isinstance(data, dict) or "error" not in data:
+        return None
+    if data.get("unavailable"):
+        return _ai_unavailable_response(data["error"])
+    return JSONResponse({"error": data["error"]}, 500)
+
+def _ai_json_response(raw_json, stale=False):
+    # Stale results are the last good answer served while the AI is unavailable; they are
+    # flagged so the page can say so.
+    if stale:
+        return FastJSONResponse({**loads(raw_json), "stale": True})
+    return RawJSONResponse(raw_json)
 
 @app.post("/api/career/roadmap/save")
 async def save_roadmap_endpoint(request: Request):
@@ -211,9 +317,7 @@ async def save_roadmap_endpoint(request: Request):
     if not domain or not roadmap_data:
         return JSONResponse({"error": "Missing domain or roadmap data"}, 400)
     
-    roadmap_json_str = json.dumps(roadmap_data)
-    
-    if save_roadmap(user["email"], domain, roadmap_json_str):
+    if save_roadmap(user["email"], domain, roadmap_data):
         return JSONResponse({"success": True})
     else:
         return JSONResponse({"error": "Failed to save roadmap"}, 500)
@@ -235,14 +339,115 @@ async def get_roadmap_api(request: Request):
     
     roadmap = get_user_roadmap(user["email"])
     if roadmap:
-        return JSONResponse({
-            "domain": roadmap["domain"],
-            "roadmap": json.loads(roadmap["roadmap_json"]),
-            "created_at": roadmap["created_at"]
-        })
+        completed = get_roadmap_completed_days(roadmap["id"])
+        weeks, days = get_roadmap_weeks(roadmap["id"], phase_index=1)
+        return RawJSONResponse(splice_object(
+            {"domain": roadmap["domain"], "created_at": roadmap["created_at"], "completed_days": completed},
+            {"roadmap": roadmap["roadmap_json"], "first_phase": _roadmap_weeks_json(weeks, days, completed)}
+        ))
     else:
         return JSONResponse(None)
 
+@app.get("/api/career/roadmap/phase/{phase_index}")
+async def get_roadmap_phase_api(request: Request, phase_index: int):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, 401)
+    
+    roadmap = get_user_roadmap(user["email"])
+    if not roadmap: return JSONResponse({"error": "Not found"}, 404)
+    
+    weeks, days = get_roadmap_weeks(roadmap["id"], phase_index=phase_index)
+    completed = get_roadmap_completed_days(roadmap["id"])
+    return RawJSONResponse(splice_object({"phase_index": phase_index}, {"weeks": _roadmap_weeks_json(weeks, days, completed)}))
+
+@app.get("/api/career/roadmap/weeks")
+async def get_roadmap_weeks_api(request: Request, start: int = 1, end: int = None):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, 401)
+    
+    roadmap = get_user_roadmap(user["email"])
+    if not roadmap: return JSONResponse({"error": "Not found"}, 404)
+    
+    if end is None: end = start
+    weeks, days = get_roadmap_weeks(roadmap["id"], start_week=start, end_week=end)
+    completed = get_roadmap_completed_days(roadmap["id"])
+    return RawJSONResponse(splice_object({"start": start, "end": end}, {"weeks": _roadmap_weeks_json(weeks, days, completed)}))
+
+@app.post("/api/career/roadmap/day/{day_index}/complete")
+async def complete_roadmap_day_api(request: Request, day_index: int):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, 401)
+    
+    roadmap = get_user_roadmap(user["email"])
+    if not roadmap: return JSONResponse({"error": "Not found"}, 404)
+    
+    data = await request.json()
+    set_roadmap_day_completed(roadmap["id"], day_index, data.get("completed", True))
+    return JSONResponse({"success": True, "completed_days": get_roadmap_completed_days(roadmap["id"])})
+
+@app.post("/api/career/roadmap/day/{day_index}")
+async def update_roadmap_day_api(request: Request, day_index: int):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, 401)
+    
+    roadmap = get_user_roadmap(user["email"])
+    if not roadmap: return JSONResponse({"error": "Not found"}, 404)
+    
+    data = await request.json()
+    topics = data.get("topics")
+    if not isinstance(topics, list):
+        return JSONResponse({"error": "Missing topics"}, 400)
+    
+    updated = update_roadmap_day(roadmap["id"], day_index, topics)
+    if updated:
+        return JSONResponse({"success": True})
+    if updated is False:
+        return JSONResponse({"error": "Day not found"}, 404)
+    return JSONResponse({"error": "Failed to update day"}, 500)
+
+def _roadmap_weeks_json(weeks, days, completed):
+    completed = set(completed)
+    days_by_week = {}
+    for d in days:
+        days_by_week.setdefault(d["week_index"], []).append(splice_object(
+            {"day_index": d["day_index"], "day_number": d["day_number"], "completed": d["day_index"] in completed},
+            {"topics": d["topics_json"]}
+        ))
+    return splice_array(
+        splice_object(dict(w), {"days": splice_array(days_by_week.get(w["week_index"], []))})
+        for w in weeks
+    )
+
+@app.get("/api/export")
+async def export_api(request: Request, format: str = "ndjson"):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if format not in ("ndjson", "zip"):
+        return JSONResponse({"error": "format must be ndjson or zip"}, status_code=400)
+
+    stamp = datetime.utcnow().strftime("%Y%m%d")
+    if format == "zip":
+        body, media_type, filename = export_zip(user["email"]), "application/zip", f"jyomarg-export-{stamp}.zip"
+    else:
+        body, media_type, filename = export_ndjson(user["email"]), "application/x-ndjson", f"jyomarg-export-{stamp}.ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/api/search")
+async def search_api(request: Request, q: str = "", kind: str = None, page: int = 1, per_page: int = 10):
+    user = request.session.get("user")
+    if not user: return JSONResponse({"error": "Unauthorized"}, 401)
+    
+    q = q.strip()
+    if not q:
+        return JSONResponse({"error": "Missing search query"}, 400)
+    if kind and kind not in ("resume", "lesson", "roadmap"):
+        return JSONResponse({"error": "Unknown kind"}, 400)
+    
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), 50)
+    results, total = search_documents(user["email"], q, kind, per_page, (page - 1) * per_page)
+    return FastJSONResponse({"query": q, "page": page, "per_page": per_page, "total": total, "results": results})
+
 @app.post("/auth/signup")
 async def handle_signup(request: Request, full_name: str = Form(...), email: str = Form(...), password: str = Form(...), confirm_password: str = Form(...)):
     if len(password) < 8:
@@ -260,15 +465,15 @@ async def handle_signup(request: Request, full_name: str = Form(...), email: str
 
 @app.post("/auth/login")
 async def handle_login(request: Request, email: str = Form(...), password: str = Form(...)):
-    print(f"[AUTH] Login attempt for: {email}")
+    log.debug("Login attempt for %s", email)
     user = get_user(email, password)
 
     if user:
-        print(f"[AUTH] Login successful for: {email}")
+        log.info("Login successful for %s", email)
         request.session["user"] = {"name": user[0], "email": user[1]}
         return RedirectResponse(url="/dashboard", status_code=303)
     else:
-        print(f"[AUTH] Login failed: Invalid credentials for {email}")
+        log.warning("Login failed: invalid credentials for %s", email)
         return HTMLResponse(content="Invalid Credentials. <a href='/login'>Try Again</a>", status_code=401)
 
 @app.get("/logout")
@@ -276,25 +481,90 @@ async def logout(request: Request):
     request.session.clear()
     return RedirectResponse(url="/")
 
+def store_job_alerts(email, alerts_data):
+    count = 0
+    for job in alerts_data.get("jobs", []):
+        if isinstance(job, dict):
+            add_notification(
+                email, 
+                job.get("job_title", "Unknown Role"), 
+                job.get("company", "Unknown Company"), 
+                job.get("match_score", 0), 
+                job.get("reason", "Profile Match"), 
+                job.get("apply_link", "#")
+            )
+            count += 1
+    return count
+
+def run_job_search(email, user_profile_dict, resume_profile):
+    alerts_data = json.loads(abhi.generate_job_alerts(user_profile_dict, resume_profile))
+    if "error" in alerts_data or not isinstance(alerts_data.get("jobs", []), list):
+        return False
+    store_job_alerts(email, alerts_data)
+    return True
+
 async def trigger_job_search(email):
     try:
         user_data = get_user_profile(email)
         if user_data:
-            active_text = get_active_resume_text(email)
+            active = get_active_resume(email)
+            resume_profile = await ensure_resume_profile(abhi, active['id']) if active else None
             
             user_profile_dict = dict(user_data)
-            user_profile_dict['resume_text'] = active_text 
+            if not resume_profile:
+                user_profile_dict['resume_text'] = active['resume_text'] if active else ""
             
-            alerts_json = abhi.generate_job_alerts(user_profile_dict)
-            alerts = json.loads(alerts_json)
-            for alert in alerts:
-                add_notification(email, alert.get("job_title"), alert.get("company"), alert.get("match_score"), alert.get("reason"), alert.get("apply_link"))
-            print(f"DEBUG: Job Search Triggered for {email}")
+            alerts_json = await run_in_threadpool(abhi.generate_job_alerts, user_profile_dict, resume_profile)
+            store_job_alerts(email, json.loads(alerts_json))
+            log.debug("Job search triggered")
             return True
-    except Exception as e:
-        print(f"Activation Search Error: {e}")
+    except Exception:
+        log.exception("Activation search failed")
         return False
 
+# user email -> task filling in the profile page's missing sections, so reloads while it runs
+# do not start a second AI search or migrate the legacy resume twice.
+_profile_fills = {}
+
+def migrate_legacy_resume(email, user_data):
+    legacy_path = user_data['resume_path']
+    filename = os.path.basename(legacy_path) or "Legacy_Resume.pdf"
+    legacy_text = user_data['resume_text'] if 'resume_text' in user_data.keys() else ""
+    if add_resume(email, filename, legacy_path, legacy_text or "", is_active=True):
+        log.info("Migrated legacy resume")
+
+async def fill_profile(email, user_data, migrate, search):
+    try:
+        if migrate:
+            await run_in_threadpool(migrate_legacy_resume, email, user_data)
+        if search:
+            await trigger_job_search(email)
+    except Exception:
+        log.exception("Profile fill failed")
+
+def schedule_profile_fill(email, user_data, notifications, resumes):
+    if email in _profile_fills:
+        return True
+    if not user_data:
+        return False
+
+    migrate = not resumes and bool(user_data['resume_path'])
+    # While the AI is failing fast the search would only come back empty.
+    search = not notifications and abhi.breaker.available()
+    if not migrate and not search:
+        return False
+
+    task = asyncio.ensure_future(fill_profile(email, user_data, migrate, search))
+    _profile_fills[email] = task
+    task.add_done_callback(lambda _: _profile_fills.pop(email, None))
+    return True
+
+async def process_resume(email, resume_id, search=False):
+    # Runs after the response is sent: extract the profile once, then reuse it for alerts.
+    await ensure_resume_profile(abhi, resume_id)
+    if search:
+        await trigger_job_search(email)
+
 @app.post("/api/resumes/upload")
 async def upload_resume_api(request: Request, resume: UploadFile = File(...)):
     user_session = request.session.get("user")
@@ -311,39 +581,34 @@ async def upload_resume_api(request: Request, resume: UploadFile = File(...)):
         filename = f"{email}_{int(os.path.getmtime(upload_dir) if os.path.exists(upload_dir) else 0)}_{resume.filename}" 
         file_path = f"{upload_dir}/{filename}"
         
-        print(f"DEBUG: Saving resume to {file_path}")
+        log.debug("Saving resume to %s", file_path)
         with open(file_path, "wb+") as file_object:
             shutil.copyfileobj(resume.file, file_object)
-        print("DEBUG: File saved successfully")
             
         resume_text = ""
         try:
-            print(f"DEBUG: Parsing PDF from {file_path}")
             reader = PyPDF2.PdfReader(file_path)
             for page in reader.pages:
                 resume_text += page.extract_text()
-            print(f"DEBUG: PDF parsed, length: {len(resume_text)}")
+            log.debug("PDF parsed, %d chars", len(resume_text))
         except Exception as e:
-             print(f"DEBUG: PDF Parse Error: {e}")
+             log.warning("PDF parse error: %s", e)
              
         existing_resumes = get_user_resumes(email)
         is_active = len(existing_resumes) == 0
-        print(f"DEBUG: Adding to DB, is_active={is_active}")
         
-        if add_resume(email, resume.filename, "/" + file_path, resume_text, is_active):
-            print("DEBUG: Resume added to DB")
-            if is_active:
-                 await trigger_job_search(email)
-
-            return JSONResponse({"message": "Resume uploaded successfully", "filename": resume.filename})
+        resume_id = add_resume(email, resume.filename, "/" + file_path, resume_text, is_active)
+        if resume_id:
+            return JSONResponse(
+                {"message": "Resume uploaded successfully", "filename": resume.filename},
+                background=BackgroundTask(process_resume, email, resume_id, search=is_active)
+            )
         else:
-            print("DEBUG: DB Error during add_resume")
+            log.error("Database error while adding resume")
             return JSONResponse({"error": "Database error"}, status_code=500)
 
     except Exception as e:
-        print(f"Resume Upload Error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Resume upload failed")
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.post("/api/resumes/delete")
@@ -367,8 +632,10 @@ async def activate_resume_api(request: Request):
     resume_id = data.get("id")
     
     if set_active_resume(resume_id, user_session["email"]):
-        await trigger_job_search(user_session["email"])
-        return JSONResponse({"message": "Activated and Search Started"})
+        return JSONResponse(
+            {"message": "Activated and Search Started"},
+            background=BackgroundTask(process_resume, user_session["email"], resume_id, search=True)
+        )
     return JSONResponse({"error": "Failed"}, status_code=500)
     
 @app.post("/profile/update")
@@ -433,14 +700,7 @@ async def mark_notif_read_api(request: Request):
     data = await request.json()
     notif_id = data.get("id")
     
-    import sqlite3
-    from database import DB_NAME
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE notifications SET is_read = 1 WHERE id = ? AND user_email = ?", (notif_id, user_session["email"]))
-    conn.commit()
-    conn.close()
-    
+    mark_notification_read(notif_id, user_session["email"])
     return JSONResponse({"status": "ok"})
 
 @app.post("/api/notifications/delete")
@@ -456,27 +716,32 @@ async def delete_notif_api(request: Request):
         return JSONResponse({"status": "ok"})
     return JSONResponse({"error": "Failed to delete"}, status_code=500)
 
+def _stored_resume_profile(request, resume_text):
+    # Reuse the extracted profile when the submitted text is one of the user's stored resumes.
+    user = request.session.get("user")
+    if not user or not resume_text:
+        return None
+    return get_resume_profile(user["email"], resume_text)
+
 @app.post("/analyze-gap")
-async def analyze_gap_endpoint(data: dict = Body(...)):
+async def analyze_gap_endpoint(request: Request, data: dict = Body(...)):
     resume = data.get("resume_text", "")
     jd = data.get("jd_text", "")
-    raw_ai_response = abhi.analyze_skill_gap(resume, jd)
+    raw_ai_response = await run_in_threadpool(abhi.analyze_skill_gap, resume, jd, _stored_resume_profile(request, resume))
     try:
-        clean_json = raw_ai_response.replace("```json", "").replace("```", "").strip()
-        parsed_json = json.loads(clean_json)
-        return JSONResponse(content=parsed_json)
+        return JSONResponse(content=json.loads(raw_ai_response))
     except:
         return JSONResponse(content={"match_score": 0, "skill_scores": {}, "missing_skills": [], "advice": "Error processing AI data."})
 
 @app.post("/ask")
 async def ask_abhi(query: str = Form(...)):
-    response_text = abhi.ask_abhi(query)
+    response_text = await run_in_threadpool(abhi.ask_abhi, query)
     return JSONResponse(content={"response": response_text})
 
 @app.post("/generate-resume")
-async def generate_resume_endpoint(data: dict = Body(...)):
-    prompt = f"Architect a professional resume for {data['name']} based on this data: {data['existing_resume']} optimized for this JD: {data['job_desc']}"
-    result = abhi.ask_abhi(prompt)
+async def generate_resume_endpoint(request: Request, data: dict = Body(...)):
+    existing = data.get("existing_resume", "")
+    result = await run_in_threadpool(abhi.generate_resume, data.get("name", ""), existing, data.get("job_desc", ""), _stored_resume_profile(request, existing))
     return {"resume_content": result}
 
 @app.get("/learn", response_class=HTMLResponse)
@@ -485,11 +750,20 @@ async def learn_page(request: Request):
     return templates.TemplateResponse("learn.html", {"request": request, "user": request.session["user"]})
 
 @app.get("/api/learn/courses")
-async def get_courses_api(request: Request):
+async def get_courses_api(request: Request, page: int = 1, per_page: int = 20):
     user = request.session.get("user")
     if not user: return JSONResponse({"error": "Unauthorized"}, 401)
-    courses = get_user_courses(user["email"])
-    return JSONResponse([dict(c) for c in courses])
+    
+    # Summaries only; the syllabus comes with /api/learn/course/{id} when a course is opened.
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), 50)
+    courses, total = list_user_courses(user["email"], per_page, (page - 1) * per_page)
+    return FastJSONResponse({"page": page, "per_page": per_page, "total": total, "courses": courses})
+
+def _course_json(course):
+    fields = dict(course)
+    syllabus = fields.pop("syllabus_json")
+    return splice_object(fields, {"syllabus_json": syllabus})
 
 @app.post("/api/learn/generate")
 async def generate_course_api(request: Request):
@@ -499,19 +773,17 @@ async def generate_course_api(request: Request):
     data = await request.json()
     topic = data.get("topic")
     
-    syllabus_json = abhi.generate_course_syllabus(topic)
+    record_request("course", topic)
+    syllabus_json, stale = await run_in_threadpool(cached_generate, "syllabus", topic_key(topic), lambda: abhi.generate_course_syllabus(topic))
     
-    try:
-        check_err = json.loads(syllabus_json)
-        if "error" in check_err:
-            return JSONResponse({"error": check_err["error"]}, 500)
-    except:
-        pass 
+    error = _ai_error_response(syllabus_json)
+    if error:
+        return error
     
-    course_id = create_course(user["email"], topic, syllabus_json)
+    course_id = create_course(user["email"], topic, loads(syllabus_json))
     
     if course_id:
-        return JSONResponse({"message": "Course created", "id": course_id})
+        return JSONResponse({"message": "Course created", "id": course_id, "stale": stale})
     return JSONResponse({"error": "Failed to create course"}, 500)
 
 @app.get("/api/learn/course/{course_id}")
@@ -522,7 +794,9 @@ async def get_course_details_api(request: Request, course_id: int):
     course = get_course_details(course_id)
     if not course: return JSONResponse({"error": "Not found"}, 404)
     
-    return JSONResponse(dict(course))
+    course = dict(course)
+    course["completed_days"] = get_completed_days(course_id)
+    return RawJSONResponse(_course_json(course))
 
 @app.get("/api/learn/course/{course_id}/content")
 async def get_day_content_api(request: Request, course_id: int):
@@ -530,24 +804,79 @@ async def get_day_content_api(request: Request, course_id: int):
     day = int(request.query_params.get("day"))
     title = request.query_params.get("title")
     
-    content = get_day_content(course_id, week, day)
+    # Only the hash is read first, so a repeat open is answered with a 304 without loading the lesson.
+    current = get_day_content_hash(course_id, week, day)
+    if current and is_current(current) and _etag_matches(request, current):
+        return Response(status_code=304, headers=_lesson_cache_headers(current))
+    
+    lesson = get_rendered_day_content(course_id, week, day)
+    stale = False
     
-    if not content:
+    if not lesson:
         course = get_course_details(course_id)
-        content = abhi.generate_day_content(course["topic"], title)
+        content, stale = await run_in_threadpool(
+            cached_generate, "lesson", lesson_key(course["topic"], title),
+            lambda: abhi.generate_day_content(course["topic"], title), lesson_ok
+        )
+        if not lesson_ok(content):
+            # Don't store the error text as the lesson; the next open tries again.
+            retry_after = abhi.breaker.retry_after()
+            return JSONResponse({"error": content, "content": content, "retry_after": retry_after}, status_code=503, headers={"Retry-After": str(retry_after)})
         save_day_content(course_id, week, day, content)
-        
-    return JSONResponse({"content": content})
+        lesson = get_rendered_day_content(course_id, week, day)
+        if not lesson:
+            return JSONResponse({"content": content})
+    
+    body = {"html": lesson["html"]} if lesson["html"] else {"content": lesson["markdown"]}
+    if stale:
+        body["stale"] = True
+    return FastJSONResponse(body, headers=_lesson_cache_headers(lesson["hash"]))
+
+def _lesson_cache_headers(content_hash):
+    # "no-cache" still lets the browser keep the lesson, but it revalidates with If-None-Match.
+    return {"ETag": f'"{content_hash}"', "Cache-Control": "private, no-cache"}
+
+def _etag_matches(request, content_hash):
+    header = request.headers.get("if-none-match", "")
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return f'"{content_hash}"' in tags or "*" in tags
 
 @app.post("/api/learn/course/{course_id}/progress")
 async def update_progress_api(request: Request, course_id: int):
     data = await request.json()
-    week = data.get("week")
-    day = data.get("day")
-    completed_days = json.dumps(data.get("completed_days")) 
+    if not isinstance(data, dict):
+        return JSONResponse({"error": "Invalid request"}, 400)
+    
+    course_days = get_course_day_keys(course_id)
+    if not course_days: return JSONResponse({"error": "Not found"}, 404)
+    
+    if data.get("week") is not None or data.get("day") is not None:
+        try:
+            week, day = int(data["week"]), int(data["day"])
+        except (KeyError, TypeError, ValueError):
+            return JSONResponse({"error": "week and day must both be integers"}, 400)
+        if (week, day) not in course_days:
+            return JSONResponse({"error": f"Week {week} day {day} is not part of this course"}, 400)
+        mark_course_day(course_id, week, day, data.get("completed", True))
+    
+    for key in data.get("completed_days") or []:
+        try:
+            week, day = (int(part) for part in str(key).split("-", 1))
+        except ValueError:
+            continue
+        if (week, day) in course_days:
+            mark_course_day(course_id, week, day)
     
-    update_course_progress(course_id, week, day, completed_days)
-    return JSONResponse({"message": "Progress updated"})
+    course = get_course_details(course_id)
+    if not course: return JSONResponse({"error": "Not found"}, 404)
+    
+    return JSONResponse({
+        "message": "Progress updated",
+        "current_week": course["current_week"],
+        "current_day": course["current_day"],
+        "completion_percent": course["completion_percent"],
+        "is_completed": bool(course["is_completed"])
+    })
 
 @app.get("/api/learn/course/{course_id}/quiz")
 async def get_quiz_api(request: Request, course_id: int):
@@ -555,9 +884,17 @@ async def get_quiz_api(request: Request, course_id: int):
     is_final = request.query_params.get("final") == "true"
     
     course = get_course_details(course_id)
-    quiz_json = abhi.generate_assessment(course["topic"], week, is_final)
-    
-    return JSONResponse(json.loads(quiz_json))
+    # Every attempt gets fresh questions; the last quiz for the topic is only reused while
+    # the AI is unavailable.
+    quiz_json, stale = await run_in_threadpool(
+        cached_generate, "quiz", quiz_key(course["topic"], week, is_final),
+        lambda: abhi.generate_assessment(course["topic"], week, is_final)
+    )
+    error = _ai_error_response(quiz_json)
+    if error:
+        return error
+    
+    return _ai_json_response(quiz_json, stale)
 
 @app.post("/api/learn/course/{course_id}/quiz/submit")
 async def submit_quiz_api(request: Request, course_id: int):
@@ -565,16 +902,15 @@ async def submit_quiz_api(request: Request, course_id: int):
     passed = data.get("passed")
     week = data.get("week")
     
-    if passed:
-        
-        pass
+    if passed and week:
+        unlock_course_week(course_id, int(week) + 1)
         
     return JSONResponse({"message": "Quiz submitted", "unlocked": passed})
 
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 9000))  
-    print(f"🚀 Starting Server on http://127.0.0.1:{port} with Auto-Reload...")
+    log.info("Starting server on http://127.0.0.1:%d", port)
 
     #uvicorn.run("app:app", host="127.0.0.1", port=port, reload=True)
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,110 @@
+import os
+import time
+import threading
+from collections import deque
+from app_logging import get_logger
+
+AI_BREAKER_WINDOW = int(os.environ.get("AI_BREAKER_WINDOW", 20))
+AI_BREAKER_MIN_CALLS = int(os.environ.get("AI_BREAKER_MIN_CALLS", 5))
+AI_BREAKER_FAILURE_RATE = float(os.environ.get("AI_BREAKER_FAILURE_RATE", 0.5))
+AI_BREAKER_OPEN_SECONDS = float(os.environ.get("AI_BREAKER_OPEN_SECONDS", 30))
+AI_BREAKER_MAX_OPEN_SECONDS = float(os.environ.get("AI_BREAKER_MAX_OPEN_SECONDS", 300))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+log = get_logger("breaker")
+
+
+class CircuitBreaker:
+    # closed: calls go through and outcomes are tracked over the last `window` calls.
+    # open: calls fail fast until `open_seconds` have passed.
+    # half_open: one probe call is let through; success closes the circuit, failure reopens
+    # it for twice as long (up to `max_open_seconds`).
+
+    def __init__(self, name, window=AI_BREAKER_WINDOW, min_calls=AI_BREAKER_MIN_CALLS,
+                 failure_rate=AI_BREAKER_FAILURE_RATE, open_seconds=AI_BREAKER_OPEN_SECONDS,
+                 max_open_seconds=AI_BREAKER_MAX_OPEN_SECONDS):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = CLOSED
+        self.open_seconds = open_seconds
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._probing = False
+
+    def available(self):
+        # Whether a call could go through right now, without claiming the half-open probe.
+        with self._lock:
+            self._refresh()
+            return self.state == CLOSED or (self.state == HALF_OPEN and not self._probing)
+
+    def allow(self):
+        with self._lock:
+            self._refresh()
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != OPEN:
+                return 1
+            return max(1, int(self.open_seconds - (time.monotonic() - self.opened_at) + 0.5))
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                log.info("%s circuit closed", self.name)
+                self.state = CLOSED
+                self.open_seconds = self.base_open_seconds
+                self._outcomes.clear()
+                self._probing = False
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trip(min(self.open_seconds * 2, self.max_open_seconds))
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if self.state == CLOSED and len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._trip(self.base_open_seconds)
+
+    def _trip(self, open_seconds):
+        self.state = OPEN
+        self.open_seconds = open_seconds
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._probing = False
+        self._outcomes.clear()
+        log.warning("%s circuit opened for %ds", self.name, open_seconds)
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._outcomes.count(False),
+                "open_seconds": self.open_seconds,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
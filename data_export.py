@@ -0,0 +1,278 @@
+import io
+import os
+import sys
+import uuid
+import zipfile
+import argparse
+from datetime import datetime
+from json_util import dumps, loads, compact
+from database import (
+    init_db, stream_query, table_columns, execute_query, execute_many,
+    execute_insert_returning_id, backfill_search_index, backfill_course_summaries
+)
+from app_logging import setup_logging
+
+EXPORT_FORMAT = "jyomarg-export"
+EXPORT_VERSION = 1
+CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH = 500
+UPLOAD_DIR = "static/uploads/resumes"
+
+_BY_COURSE = "course_id IN (SELECT id FROM courses WHERE user_email = ?)"
+_BY_ROADMAP = "roadmap_id IN (SELECT id FROM roadmaps WHERE user_email = ?)"
+
+# (table, filter on the user's email, foreign key to remap) in dependency order:
+# parents always come before the rows that point at them.
+SECTIONS = [
+    ("users", "email = ?", None),
+    ("resumes", "user_email = ?", None),
+    ("courses", "user_email = ?", None),
+    ("course_progress", "user_email = ?", ("course_id", "courses")),
+    ("course_days", _BY_COURSE, ("course_id", "courses")),
+    ("course_content", _BY_COURSE, ("course_id", "courses")),
+    ("assessments", _BY_COURSE, ("course_id", "courses")),
+    ("roadmaps", "user_email = ?", None),
+    ("roadmap_weeks", _BY_ROADMAP, ("roadmap_id", "roadmaps")),
+    ("roadmap_days", _BY_ROADMAP, ("roadmap_id", "roadmaps")),
+    ("roadmap_day_progress", _BY_ROADMAP, ("roadmap_id", "roadmaps")),
+    ("notifications", "user_email = ?", None),
+]
+
+FOREIGN_KEYS = {table: fk for table, _, fk in SECTIONS}
+
+# Tables whose new ids are needed later (to remap children or attach resume files),
+# so they are inserted row by row; everything else goes in batches.
+PARENT_TABLES = {"resumes", "courses", "roadmaps"}
+JSON_COLUMNS = {"courses": "syllabus_json", "roadmaps": "roadmap_json"}
+EMAIL_COLUMNS = ("email", "user_email")
+
+
+def export_lines(user_email, include_credentials=False):
+    yield dumps({
+        "format": EXPORT_FORMAT,
+        "version": EXPORT_VERSION,
+        "user_email": user_email,
+        "exported_at": datetime.utcnow().isoformat() + "Z",
+    }) + b"\n"
+
+    for table, where, _ in SECTIONS:
+        for row in stream_query(f"SELECT * FROM {table} WHERE {where} ORDER BY id", (user_email,)):
+            if table == "users" and not include_credentials:
+                row.pop("password", None)
+            yield dumps({"table": table, "row": row}) + b"\n"
+
+
+def export_ndjson(user_email, include_credentials=False):
+    # Groups lines into ~64KB chunks so the response is not thousands of tiny writes.
+    buffer = []
+    size = 0
+    for line in export_lines(user_email, include_credentials):
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+class _Sink(io.RawIOBase):
+    # Unseekable target for ZipFile; whatever it writes is handed out on drain().
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _resume_file(file_path):
+    path = os.path.realpath((file_path or "").lstrip("/"))
+    uploads = os.path.realpath(UPLOAD_DIR)
+    if path.startswith(uploads + os.sep) and os.path.isfile(path):
+        return path
+    return None
+
+
+def export_zip(user_email, include_credentials=False):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("data.ndjson", "w") as data:
+            for chunk in export_ndjson(user_email, include_credentials):
+                data.write(chunk)
+                yield sink.drain()
+
+        for row in stream_query("SELECT id, file_path FROM resumes WHERE user_email = ? ORDER BY id", (user_email,)):
+            path = _resume_file(row["file_path"])
+            if path:
+                archive.write(path, f"files/{row['id']}/{os.path.basename(path)}")
+                yield sink.drain()
+    yield sink.drain()
+
+
+class _Importer:
+    def __init__(self, target_email=None):
+        self.target_email = target_email
+        self.id_maps = {table: {} for table in PARENT_TABLES}
+        self.columns = {}
+        self.pending_table = None
+        self.pending = []
+        self.counts = {}
+        self.has_active_resume = False
+
+    def _columns(self, table):
+        if table not in self.columns:
+            self.columns[table] = [c for c in table_columns(table) if c != "id"]
+        return self.columns[table]
+
+    def start(self, meta):
+        if meta.get("format") != EXPORT_FORMAT:
+            raise ValueError("Not a JYOMARG export")
+        if meta.get("version", 0) > EXPORT_VERSION:
+            raise ValueError(f"Export version {meta['version']} is newer than this importer")
+        self.target_email = self.target_email or meta["user_email"]
+        self.has_active_resume = bool(execute_query(
+            "SELECT id FROM resumes WHERE user_email = ? AND is_active = 1", (self.target_email,), fetch_mode='one'
+        ))
+
+    def add(self, table, row):
+        if table not in FOREIGN_KEYS:
+            return
+        old_id = row.pop("id", None)
+        for col in EMAIL_COLUMNS:
+            if col in row:
+                row[col] = self.target_email
+
+        fk = FOREIGN_KEYS[table]
+        if fk:
+            new_parent = self.id_maps[fk[1]].get(row.get(fk[0]))
+            if new_parent is None:
+                return
+            row[fk[0]] = new_parent
+        if table in JSON_COLUMNS and not isinstance(row.get(JSON_COLUMNS[table]), str):
+            row[JSON_COLUMNS[table]] = compact(row[JSON_COLUMNS[table]])
+        if table == "resumes" and self.has_active_resume:
+            row["is_active"] = 0
+        if table == "users":
+            if execute_query("SELECT id FROM users WHERE email = ?", (self.target_email,), fetch_mode='one'):
+                return
+            row.setdefault("password", uuid.uuid4().hex)
+
+        columns = [c for c in self._columns(table) if c in row]
+        values = tuple(row[c] for c in columns)
+        if table in PARENT_TABLES:
+            self.flush()
+            placeholders = ",".join("?" * len(columns))
+            new_id = execute_insert_returning_id(f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})", values)
+            if new_id:
+                self.id_maps[table][old_id] = new_id
+                self.counts[table] = self.counts.get(table, 0) + 1
+            return
+
+        if self.pending_table != (table, tuple(columns)):
+            self.flush()
+            self.pending_table = (table, tuple(columns))
+        self.pending.append(values)
+        if len(self.pending) >= IMPORT_BATCH:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        table, columns = self.pending_table
+        placeholders = ",".join("?" * len(columns))
+        if execute_many(f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})", self.pending):
+            self.counts[table] = self.counts.get(table, 0) + len(self.pending)
+        self.pending = []
+
+
+def import_lines(lines, target_email=None):
+    importer = _Importer(target_email)
+    for number, line in enumerate(lines):
+        if not line.strip():
+            continue
+        record = loads(line)
+        if number == 0:
+            importer.start(record)
+        else:
+            importer.add(record["table"], record["row"])
+    importer.flush()
+    backfill_course_summaries()
+    backfill_search_index()
+    return importer
+
+
+def import_file(path, target_email=None):
+    if not zipfile.is_zipfile(path):
+        with open(path, "rb") as f:
+            return import_lines(f, target_email).counts
+
+    with zipfile.ZipFile(path) as archive:
+        with archive.open("data.ndjson") as f:
+            importer = import_lines(f, target_email)
+
+        # Resume PDFs get fresh names in this deployment's upload folder.
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        moved = 0
+        for name in archive.namelist():
+            parts = name.split("/")
+            if len(parts) != 3 or parts[0] != "files" or not parts[1].isdigit():
+                continue
+            resume_id = importer.id_maps["resumes"].get(int(parts[1]))
+            if not resume_id:
+                continue
+            filename = f"{importer.target_email}_{uuid.uuid4().hex[:8]}_{os.path.basename(parts[2])}"
+            with archive.open(name) as src, open(os.path.join(UPLOAD_DIR, filename), "wb") as dst:
+                while True:
+                    block = src.read(CHUNK_BYTES)
+                    if not block:
+                        break
+                    dst.write(block)
+            execute_query("UPDATE resumes SET file_path = ? WHERE id = ?", (f"/{UPLOAD_DIR}/{filename}", resume_id), commit=True)
+            moved += 1
+        importer.counts["files"] = moved
+        return importer.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import a user's JYOMARG data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    exp = commands.add_parser("export", help="write a user's data as NDJSON or a zip archive")
+    exp.add_argument("email")
+    exp.add_argument("-o", "--output", help="output file (default: stdout)")
+    exp.add_argument("--format", choices=("ndjson", "zip"), default="ndjson")
+    exp.add_argument("--with-credentials", action="store_true", help="include the password so the account can log in after import")
+
+    imp = commands.add_parser("import", help="load an export into this deployment")
+    imp.add_argument("path")
+    imp.add_argument("--as", dest="target_email", help="import under a different email")
+
+    args = parser.parse_args(argv)
+    # stdout may be the export itself.
+    setup_logging(stream=sys.stderr)
+    init_db()
+
+    if args.command == "export":
+        chunks = (export_zip if args.format == "zip" else export_ndjson)(args.email, args.with_credentials)
+        out = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    else:
+        print(import_file(args.path, args.target_email))
+
+
+if __name__ == "__main__":
+    main()
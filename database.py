@@ -1,30 +1,86 @@
 import os
+import re
+import html
+import time
+import uuid
+import hashlib
+import logging
 import sqlite3
+import threading
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from psycopg2.extras import RealDictCursor
+from json_util import compact, loads
+from lesson_render import render_lesson, content_hash, is_current
+from app_logging import get_logger
+from profiler import timed_phase
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
 SQLITE_DB_NAME = "users.db"
 
-def get_db_connection():
+log = get_logger("db")
+# Per-query timings are very noisy; keep a fraction of them even at DEBUG.
+QUERY_LOG_SAMPLE_RATE = float(os.environ.get("LOG_QUERY_SAMPLE_RATE", 0.1))
+# PostgreSQL connections are reused from a pool; a caller waits this long for a free one.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises instead of waiting when it is exhausted.
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+
+def _sql_summary(sql):
+    # Errors name the statement and table only; full SQL and parameters stay out of the logs.
+    verb = sql.strip().split(None, 1)[0].upper() if sql.strip() else "?"
+    table = re.search(r"\b(?:FROM|INTO|UPDATE|TABLE|EXISTS)\s+(?!IF\b)(\w+)", sql, re.I)
+    return f"{verb} {table.group(1)}" if table else verb
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadedConnectionPool(1, DB_POOL_SIZE, DATABASE_URL, sslmode='require')
+        return _pool
+
+@timed_phase("db")
+def get_db_connection(any_thread=False):
     if DATABASE_URL:
+        if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+            log.error("PostgreSQL pool exhausted after %ss", DB_POOL_TIMEOUT)
+            return None
         try:
-            conn = psycopg2.connect(DATABASE_URL, sslmode='require')
-            return conn
+            return _get_pool().getconn()
         except Exception as e:
-            print(f"[DB] PostgreSQL Connection Error: {e}")
+            _pool_slots.release()
+            log.error("PostgreSQL connection error: %s", e)
             return None
     else:
-        conn = sqlite3.connect(SQLITE_DB_NAME)
+        # SQLite connections are a local file open; not worth pooling.
+        conn = sqlite3.connect(SQLITE_DB_NAME, check_same_thread=not any_thread)
         conn.row_factory = sqlite3.Row 
         return conn
 
+def release_connection(conn):
+    # The pool rolls back anything left uncommitted and drops connections that were closed.
+    if DATABASE_URL:
+        try:
+            _get_pool().putconn(conn)
+        finally:
+            _pool_slots.release()
+    else:
+        conn.close()
+
+@timed_phase("db")
 def execute_query(sql, params=(), fetch_mode=None, commit=False):
     conn = get_db_connection()
     if not conn:
         return None
 
+    # Checked once so the timing costs nothing unless DEBUG is on.
+    timed = log.isEnabledFor(logging.DEBUG)
+    start = time.perf_counter() if timed else 0
     try:
         if DATABASE_URL:
             sql = sql.replace("?", "%s")
@@ -48,13 +104,19 @@ def execute_query(sql, params=(), fetch_mode=None, commit=False):
             elif not DATABASE_URL and sql.strip().upper().startswith("INSERT"):
                  result = cursor.lastrowid 
 
+        if timed:
+            log.debug(
+                "%s in %.1fms", _sql_summary(sql), (time.perf_counter() - start) * 1000,
+                extra={"sample_rate": QUERY_LOG_SAMPLE_RATE}
+            )
         return result
     except Exception as e:
-        print(f"[DB] Query Error: {e}\nQuery: {sql}")
+        log.error("Query error: %s", e, extra={"sql": _sql_summary(sql)})
         return None
     finally:
-        conn.close()
+        release_connection(conn)
 
+@timed_phase("db")
 def execute_insert_returning_id(sql, params=()):
     conn = get_db_connection()
     if not conn: return None
@@ -75,13 +137,97 @@ def execute_insert_returning_id(sql, params=()):
             conn.commit()
             return cursor.lastrowid
     except Exception as e:
-        print(f"[DB] Insert Error: {e}")
+        log.error("Insert error: %s", e, extra={"sql": _sql_summary(sql)})
         return None
     finally:
-        conn.close()
+        release_connection(conn)
+
+@timed_phase("db")
+def execute_transaction(statements):
+    # Runs (sql, params) pairs on one connection and commits once; returns the row counts.
+    conn = get_db_connection()
+    if not conn: return None
+
+    try:
+        cursor = conn.cursor()
+        counts = []
+        for sql, params in statements:
+            if DATABASE_URL:
+                sql = sql.replace("?", "%s")
+            cursor.execute(sql, params)
+            counts.append(cursor.rowcount)
+        conn.commit()
+        return counts
+    except Exception as e:
+        log.error("Transaction error: %s", e, extra={"statements": len(statements)})
+        conn.rollback()
+        return None
+    finally:
+        release_connection(conn)
+
+def stream_query(sql, params=(), chunk_size=500):
+    # Yields rows as dicts without loading the result set; on Postgres a named cursor keeps it server-side.
+    # A streamed response resumes the generator on whichever threadpool thread is free (one at a time).
+    conn = get_db_connection(any_thread=True)
+    if not conn: return
+
+    try:
+        if DATABASE_URL:
+            sql = sql.replace("?", "%s")
+            cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=RealDictCursor)
+            cursor.itersize = chunk_size
+        else:
+            cursor = conn.cursor()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    finally:
+        release_connection(conn)
+
+@timed_phase("db")
+def table_columns(table):
+    conn = get_db_connection()
+    if not conn: return []
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+        return [col[0] for col in cursor.description]
+    except Exception as e:
+        log.error("Column lookup error (%s): %s", table, e)
+        return []
+    finally:
+        release_connection(conn)
+
+@timed_phase("db")
+def execute_many(sql, seq_of_params):
+    seq_of_params = list(seq_of_params)
+    if not seq_of_params:
+        return True
+
+    conn = get_db_connection()
+    if not conn: return False
+
+    try:
+        if DATABASE_URL:
+            sql = sql.replace("?", "%s")
+        cursor = conn.cursor()
+        cursor.executemany(sql, seq_of_params)
+        conn.commit()
+        return True
+    except Exception as e:
+        log.error("Batch error: %s", e, extra={"sql": _sql_summary(sql), "rows": len(seq_of_params)})
+        conn.rollback()
+        return False
+    finally:
+        release_connection(conn)
 
 def init_db():
-    print(f"[DB] Initializing database... (Mode: {'PostgreSQL' if DATABASE_URL else 'SQLite'})")
+    log.info("Initializing database (mode: %s)", "PostgreSQL" if DATABASE_URL else "SQLite")
     
     users_table = """
         CREATE TABLE IF NOT EXISTS users (
@@ -109,10 +255,17 @@ def init_db():
     create_resumes_table()
     create_learn_tables()
     create_roadmaps_table()
+    create_search_tables()
+    create_ai_cache_tables()
     
     migrate_columns()
+    migrate_json_columns()
+    backfill_course_days()
+    backfill_course_summaries()
+    backfill_resume_hashes()
+    backfill_search_index()
     
-    print("[DB] Database initialized successfully.")
+    log.info("Database initialized")
 
 def create_learn_tables():
     courses_sql = """
@@ -121,7 +274,11 @@ def create_learn_tables():
             user_email TEXT NOT NULL,
             topic TEXT NOT NULL,
             syllabus_json TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            title TEXT,
+            description TEXT,
+            total_weeks INTEGER,
+            total_days INTEGER
         )
     """
     execute_query(courses_sql, commit=True)
@@ -133,6 +290,7 @@ def create_learn_tables():
             course_id INTEGER NOT NULL,
             current_week INTEGER DEFAULT 1,
             current_day INTEGER DEFAULT 1,
+            unlocked_week INTEGER DEFAULT 1,
             completed_days_json TEXT DEFAULT '[]',
             is_completed BOOLEAN DEFAULT 0
         )
@@ -145,7 +303,9 @@ def create_learn_tables():
             course_id INTEGER NOT NULL,
             week_number INTEGER NOT NULL,
             day_number INTEGER NOT NULL,
-            content_markdown TEXT NOT NULL
+            content_markdown TEXT NOT NULL,
+            content_html TEXT,
+            content_hash TEXT
         )
     """
     execute_query(content_sql, commit=True)
@@ -164,6 +324,19 @@ def create_learn_tables():
     """
     execute_query(assessments_sql, commit=True)
 
+    days_sql = """
+        CREATE TABLE IF NOT EXISTS course_days (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER NOT NULL,
+            week_number INTEGER NOT NULL,
+            day_number INTEGER NOT NULL,
+            title TEXT,
+            completed_at TIMESTAMP
+        )
+    """
+    execute_query(days_sql, commit=True)
+    execute_query("CREATE UNIQUE INDEX IF NOT EXISTS idx_course_days_day ON course_days (course_id, week_number, day_number)", commit=True)
+
 def create_notifications_table():
     sql = """
         CREATE TABLE IF NOT EXISTS notifications (
@@ -175,10 +348,47 @@ def create_notifications_table():
             reason TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             is_read BOOLEAN DEFAULT 0,
-            apply_link TEXT
+            apply_link TEXT,
+            duplicate_count INTEGER DEFAULT 1,
+            emailed_at TIMESTAMP
         )
     """
     execute_query(sql, commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications (user_email, created_at)", commit=True)
+
+    archive_sql = """
+        CREATE TABLE IF NOT EXISTS notifications_archive (
+            id INTEGER PRIMARY KEY,
+            user_email TEXT NOT NULL,
+            job_title TEXT NOT NULL,
+            company TEXT NOT NULL,
+            match_score INTEGER,
+            reason TEXT,
+            created_at TIMESTAMP,
+            is_read BOOLEAN DEFAULT 0,
+            apply_link TEXT,
+            duplicate_count INTEGER DEFAULT 1,
+            archive_reason TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    execute_query(archive_sql, commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_notifications_archive_archived ON notifications_archive (archived_at)", commit=True)
+
+    job_runs_sql = """
+        CREATE TABLE IF NOT EXISTS job_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            started_at TIMESTAMP,
+            duration_ms INTEGER,
+            processed INTEGER DEFAULT 0,
+            stats_json TEXT,
+            error TEXT
+        )
+    """
+    execute_query(job_runs_sql, commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_job_runs_name ON job_runs (job_name, started_at)", commit=True)
 
 def create_resumes_table():
     sql = """
@@ -189,7 +399,11 @@ def create_resumes_table():
             file_path TEXT NOT NULL,
             resume_text TEXT,
             is_active BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            text_hash TEXT,
+            profile_json TEXT,
+            profile_hash TEXT,
+            profile_updated_at TIMESTAMP
         )
     """
     execute_query(sql, commit=True)
@@ -206,32 +420,102 @@ def create_roadmaps_table():
     """
     execute_query(sql, commit=True)
 
+    weeks_sql = """
+        CREATE TABLE IF NOT EXISTS roadmap_weeks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            roadmap_id INTEGER NOT NULL,
+            phase_index INTEGER NOT NULL,
+            week_index INTEGER NOT NULL,
+            week_number INTEGER,
+            week_title TEXT
+        )
+    """
+    execute_query(weeks_sql, commit=True)
+
+    days_sql = """
+        CREATE TABLE IF NOT EXISTS roadmap_days (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            roadmap_id INTEGER NOT NULL,
+            week_index INTEGER NOT NULL,
+            day_index INTEGER NOT NULL,
+            day_number INTEGER,
+            topics_json TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    execute_query(days_sql, commit=True)
+
+    progress_sql = """
+        CREATE TABLE IF NOT EXISTS roadmap_day_progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            roadmap_id INTEGER NOT NULL,
+            day_index INTEGER NOT NULL,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    execute_query(progress_sql, commit=True)
+
+    execute_query("CREATE INDEX IF NOT EXISTS idx_roadmap_weeks_roadmap ON roadmap_weeks (roadmap_id, week_index)", commit=True)
+    execute_query("CREATE UNIQUE INDEX IF NOT EXISTS idx_roadmap_days_day ON roadmap_days (roadmap_id, day_index)", commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_roadmap_days_week ON roadmap_days (roadmap_id, week_index)", commit=True)
+    execute_query("CREATE UNIQUE INDEX IF NOT EXISTS idx_roadmap_progress_day ON roadmap_day_progress (roadmap_id, day_index)", commit=True)
+
 def migrate_columns():
     
     migrations = [
         ("users", "resume_path", "TEXT"),
         ("users", "resume_text", "TEXT"),
-        ("notifications", "apply_link", "TEXT")
+        ("notifications", "apply_link", "TEXT"),
+        ("notifications", "duplicate_count", "INTEGER DEFAULT 1"),
+        ("notifications", "emailed_at", "TIMESTAMP"),
+        ("course_content", "content_html", "TEXT"),
+        ("course_content", "content_hash", "TEXT"),
+        ("course_progress", "unlocked_week", "INTEGER DEFAULT 1"),
+        ("courses", "title", "TEXT"),
+        ("courses", "description", "TEXT"),
+        ("courses", "total_weeks", "INTEGER"),
+        ("courses", "total_days", "INTEGER"),
+        ("resumes", "text_hash", "TEXT"),
+        ("resumes", "profile_json", "TEXT"),
+        ("resumes", "profile_hash", "TEXT"),
+        ("resumes", "profile_updated_at", "TIMESTAMP"),
+        ("ai_cache", "served_at", "TIMESTAMP")
     ]
     
     for table, col, type_def in migrations:
-        try:
-            execute_query(f"SELECT {col} FROM {table} LIMIT 1")
-        except:
-            print(f"[DB] Migrating {table}: Adding {col}")
+        if execute_query(f"SELECT {col} FROM {table} LIMIT 1", fetch_mode='all') is None:
+            log.info("Migrating %s: adding %s", table, col)
             try:
                 execute_query(f"ALTER TABLE {table} ADD COLUMN {col} {type_def}", commit=True)
             except Exception as e:
-                print(f"[DB] Migration Error ({table}.{col}): {e}")
+                log.error("Migration error (%s.%s): %s", table, col, e)
+
+def migrate_json_columns():
+    if not DATABASE_URL:
+        return
+
+    json_columns = [
+        ("courses", "syllabus_json"),
+        ("roadmaps", "roadmap_json")
+    ]
+
+    for table, col in json_columns:
+        row = execute_query(
+            "SELECT data_type FROM information_schema.columns WHERE table_name=? AND column_name=?",
+            (table, col), fetch_mode='one'
+        )
+        if row and row['data_type'] != 'jsonb':
+            log.info("Migrating %s.%s to JSONB", table, col)
+            execute_query(f"ALTER TABLE {table} ALTER COLUMN {col} TYPE JSONB USING {col}::jsonb", commit=True)
 
 def add_user(full_name, email, password):
     sql = "INSERT INTO users (full_name, email, password) VALUES (?, ?, ?)"
     try:
         execute_query(sql, (full_name, email, password), commit=True)
-        print(f"[DB] User added: {email}")
+        log.info("User added", extra={"email": email})
         return True
     except Exception as e:
-        print(f"[DB] Add User Error (likely exists): {e}")
+        log.warning("Add user error (likely exists): %s", e)
         return False
 
 def get_user(email, password):
@@ -242,6 +526,31 @@ def get_user(email, password):
         return (result['full_name'], result['email'])
     return None
 
+@timed_phase("db")
+def execute_reads(queries):
+    # Runs (sql, params, fetch_mode) reads on one connection, so a page needing several
+    # result sets checks out a single connection instead of one per query.
+    conn = get_db_connection()
+    if not conn: return None
+
+    try:
+        if DATABASE_URL:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+        else:
+            cursor = conn.cursor()
+        results = []
+        for sql, params, fetch_mode in queries:
+            if DATABASE_URL:
+                sql = sql.replace("?", "%s")
+            cursor.execute(sql, params)
+            results.append(cursor.fetchone() if fetch_mode == 'one' else cursor.fetchall())
+        return results
+    except Exception as e:
+        log.error("Read error: %s", e, extra={"queries": len(queries)})
+        return None
+    finally:
+        release_connection(conn)
+
 def get_user_profile(email):
     sql = "SELECT * FROM users WHERE email = ?"
     return execute_query(sql, (email,), fetch_mode='one')
@@ -280,6 +589,68 @@ def add_notification(user_email, job_title, company, match_score, reason, apply_
     except:
         return False
 
+def add_notifications(rows):
+    # rows: (user_email, job_title, company, match_score, reason, apply_link)
+    sql = """
+        INSERT INTO notifications (user_email, job_title, company, match_score, reason, apply_link)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+    return execute_many(sql, rows)
+
+def get_digest_batch(max_users, max_items):
+    # Unread alerts that have not been emailed yet, best matches first, for up to max_users users.
+    users = execute_query(
+        "SELECT user_email FROM notifications WHERE emailed_at IS NULL AND is_read = 0 GROUP BY user_email ORDER BY MIN(id) LIMIT ?",
+        (max_users,), fetch_mode='all'
+    ) or []
+    if not users:
+        return []
+
+    emails = [u['user_email'] for u in users]
+    placeholders = ",".join("?" * len(emails))
+    rows = execute_query(
+        f"""
+            SELECT n.id, n.user_email, u.full_name, n.job_title, n.company, n.match_score, n.reason, n.apply_link
+            FROM notifications n
+            JOIN users u ON u.email = n.user_email
+            WHERE n.emailed_at IS NULL AND n.is_read = 0 AND n.user_email IN ({placeholders})
+            ORDER BY n.user_email, n.match_score DESC, n.id DESC
+        """,
+        tuple(emails), fetch_mode='all'
+    ) or []
+
+    digests = {}
+    for row in rows:
+        digest = digests.setdefault(row['user_email'], {"email": row['user_email'], "name": row['full_name'], "items": [], "ids": []})
+        digest["ids"].append(row['id'])
+        if len(digest["items"]) < max_items:
+            digest["items"].append(dict(row))
+    return list(digests.values())
+
+def mark_notifications_emailed(ids, chunk_size=500):
+    ids = list(ids)
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        placeholders = ",".join("?" * len(chunk))
+        execute_query(f"UPDATE notifications SET emailed_at=CURRENT_TIMESTAMP WHERE id IN ({placeholders})", tuple(chunk), commit=True)
+
+def get_alert_refresh_candidates(stale_before, limit):
+    # Users with a resume or listed skills whose newest alert is older than stale_before.
+    sql = """
+        SELECT u.email, u.skills, u.experience_years, u.degree, u.university, u.grad_year, u.location, u.bio,
+            CASE WHEN r.profile_hash = r.text_hash THEN r.profile_json END AS profile_json,
+            CASE WHEN r.profile_hash = r.text_hash THEN NULL ELSE r.resume_text END AS resume_text
+        FROM users u
+        LEFT JOIN resumes r ON r.user_email = u.email AND r.is_active = 1
+        WHERE (r.id IS NOT NULL OR COALESCE(u.skills, '') <> '')
+          AND NOT EXISTS (
+              SELECT 1 FROM notifications n WHERE n.user_email = u.email AND n.created_at >= ?
+          )
+        ORDER BY u.id
+        LIMIT ?
+    """
+    return execute_query(sql, (stale_before, limit), fetch_mode='all') or []
+
 def get_notifications(user_email, limit=20):
     sql = """
         SELECT * FROM notifications 
@@ -294,6 +665,10 @@ def mark_notifications_read(user_email):
     sql = "UPDATE notifications SET is_read = 1 WHERE user_email = ?"
     execute_query(sql, (user_email,), commit=True)
 
+def mark_notification_read(notif_id, user_email):
+    sql = "UPDATE notifications SET is_read = 1 WHERE id = ? AND user_email = ?"
+    execute_query(sql, (notif_id, user_email), commit=True)
+
 def delete_notification(notif_id, user_email):
     sql = "DELETE FROM notifications WHERE id=? AND user_email=?"
     try:
@@ -302,30 +677,157 @@ def delete_notification(notif_id, user_email):
     except:
         return False
 
+_ARCHIVE_COLUMNS = "id, user_email, job_title, company, match_score, reason, created_at, is_read, apply_link, duplicate_count"
+
+def find_duplicate_notifications(limit):
+    sql = """
+        SELECT user_email, LOWER(job_title) AS title_key, LOWER(company) AS company_key
+        FROM notifications
+        GROUP BY user_email, LOWER(job_title), LOWER(company)
+        HAVING COUNT(*) > 1
+        LIMIT ?
+    """
+    return execute_query(sql, (limit,), fetch_mode='all') or []
+
+def merge_duplicate_notifications(groups):
+    # Keeps the newest alert of each group with the best score, and unread if any copy was unread.
+    statements = []
+    for group in groups:
+        rows = execute_query(
+            """
+                SELECT id, match_score, is_read, duplicate_count FROM notifications
+                WHERE user_email=? AND LOWER(job_title)=? AND LOWER(company)=?
+                ORDER BY created_at DESC, id DESC
+            """,
+            (group['user_email'], group['title_key'], group['company_key']), fetch_mode='all'
+        ) or []
+        if len(rows) < 2:
+            continue
+        keep, drop = rows[0], [r['id'] for r in rows[1:]]
+        statements.append((
+            "UPDATE notifications SET match_score=?, is_read=?, duplicate_count=? WHERE id=?",
+            (
+                max(r['match_score'] or 0 for r in rows),
+                1 if all(r['is_read'] for r in rows) else 0,
+                sum(r['duplicate_count'] or 1 for r in rows),
+                keep['id']
+            )
+        ))
+        placeholders = ",".join("?" * len(drop))
+        statements.append((f"DELETE FROM notifications WHERE id IN ({placeholders})", tuple(drop)))
+
+    counts = execute_transaction(statements) if statements else None
+    return sum(counts[1::2]) if counts else 0
+
+def find_notifications_to_archive(read_before, expire_before, max_per_user, limit):
+    # Returns (id, reason) pairs: read items past the grace period, anything past the TTL,
+    # and whatever falls beyond a user's newest max_per_user alerts.
+    sql = """
+        SELECT id, CASE
+                WHEN created_at < ? THEN 'expired'
+                WHEN rn > ? THEN 'overflow'
+                ELSE 'read'
+            END AS archive_reason
+        FROM (
+            SELECT id, created_at, is_read,
+                ROW_NUMBER() OVER (PARTITION BY user_email ORDER BY created_at DESC, id DESC) AS rn
+            FROM notifications
+        ) ranked
+        WHERE created_at < ? OR rn > ? OR (is_read = 1 AND created_at < ?)
+        LIMIT ?
+    """
+    params = (expire_before, max_per_user, expire_before, max_per_user, read_before, limit)
+    return [(r['id'], r['archive_reason']) for r in execute_query(sql, params, fetch_mode='all') or []]
+
+def archive_notifications(id_reasons):
+    if not id_reasons:
+        return 0
+    by_reason = {}
+    for notif_id, reason in id_reasons:
+        by_reason.setdefault(reason, []).append(notif_id)
+
+    statements = []
+    for reason, ids in by_reason.items():
+        placeholders = ",".join("?" * len(ids))
+        statements.append((
+            f"INSERT INTO notifications_archive ({_ARCHIVE_COLUMNS}, archive_reason) "
+            f"SELECT {_ARCHIVE_COLUMNS}, ? FROM notifications WHERE id IN ({placeholders})",
+            (reason, *ids)
+        ))
+        statements.append((f"DELETE FROM notifications WHERE id IN ({placeholders})", tuple(ids)))
+
+    counts = execute_transaction(statements)
+    return sum(counts[1::2]) if counts else 0
+
+def purge_archived_notifications(before, limit):
+    sql = """
+        DELETE FROM notifications_archive WHERE id IN (
+            SELECT id FROM notifications_archive WHERE archived_at < ? LIMIT ?
+        )
+    """
+    counts = execute_transaction([(sql, (before, limit))])
+    return counts[0] if counts else 0
+
+def record_job_run(job_name, status, started_at, duration_ms, processed=0, stats=None, error=None):
+    sql = """
+        INSERT INTO job_runs (job_name, status, started_at, duration_ms, processed, stats_json, error)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+    execute_query(sql, (job_name, status, started_at, duration_ms, processed, compact(stats or {}), error), commit=True)
+
+def get_job_runs(job_name=None, limit=20):
+    if job_name:
+        sql = "SELECT * FROM job_runs WHERE job_name=? ORDER BY id DESC LIMIT ?"
+        params = (job_name, limit)
+    else:
+        sql = "SELECT * FROM job_runs ORDER BY id DESC LIMIT ?"
+        params = (limit,)
+    return execute_query(sql, params, fetch_mode='all') or []
+
 def add_resume(user_email, filename, file_path, resume_text, is_active=False):
     try:
         if is_active:
             execute_query("UPDATE resumes SET is_active=0 WHERE user_email=?", (user_email,), commit=True)
         
         sql = """
-            INSERT INTO resumes (user_email, filename, file_path, resume_text, is_active)
-            VALUES (?, ?, ?, ?, ?)
+            INSERT INTO resumes (user_email, filename, file_path, resume_text, is_active, text_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
         """
-        execute_query(sql, (user_email, filename, file_path, resume_text, is_active), commit=True)
-        return True
+        resume_id = execute_insert_returning_id(sql, (user_email, filename, file_path, resume_text, is_active, resume_text_hash(resume_text)))
+        if resume_id:
+            index_documents([(user_email, "resume", resume_id, filename, resume_text)])
+        return resume_id
     except Exception as e:
-        print(f"Add Resume Error: {e}")
-        return False
+        log.error("Add resume error: %s", e)
+        return None
 
 def get_user_resumes(user_email):
     sql = "SELECT * FROM resumes WHERE user_email=? ORDER BY created_at DESC"
     res = execute_query(sql, (user_email,), fetch_mode='all')
     return res if res else []
 
+def get_profile_page_data(user_email, notification_limit=20):
+    # Everything the profile page shows; resume text and notification bookkeeping columns stay behind.
+    results = execute_reads([
+        ("SELECT * FROM users WHERE email = ?", (user_email,), 'one'),
+        ("""
+            SELECT id, job_title, company, match_score, reason, apply_link, is_read, created_at
+            FROM notifications WHERE user_email = ?
+            ORDER BY created_at DESC LIMIT ?
+        """, (user_email, notification_limit), 'all'),
+        ("SELECT id, filename, is_active, created_at FROM resumes WHERE user_email=? ORDER BY created_at DESC", (user_email,), 'all'),
+    ])
+    if results is None:
+        return None, [], []
+    user, notifications, resumes = results
+    return user, [dict(n) for n in notifications], [dict(r) for r in resumes]
+
 def delete_resume(resume_id, user_email):
     sql = "DELETE FROM resumes WHERE id=? AND user_email=?"
     try:
         execute_query(sql, (resume_id, user_email), commit=True)
+        if not execute_query("SELECT id FROM resumes WHERE id=?", (resume_id,), fetch_mode='one'):
+            remove_documents("resume", resume_id)
         return True
     except:
         return False
@@ -345,75 +847,802 @@ def get_active_resume_text(user_email):
         return res['resume_text']
     return ""
 
+def get_active_resume(user_email):
+    sql = "SELECT id, resume_text FROM resumes WHERE user_email=? AND is_active=1"
+    return execute_query(sql, (user_email,), fetch_mode='one')
+
+def resume_text_hash(text):
+    # Whitespace-insensitive so text pasted back from the same PDF still matches.
+    normalized = " ".join((text or "").split())
+    return hashlib.sha256(normalized.encode("utf-8", "ignore")).hexdigest()
+
+def backfill_resume_hashes():
+    rows = execute_query("SELECT id, resume_text FROM resumes WHERE text_hash IS NULL", fetch_mode='all') or []
+    if rows:
+        log.info("Hashing %d resumes", len(rows))
+        execute_many("UPDATE resumes SET text_hash=? WHERE id=?", [(resume_text_hash(r['resume_text']), r['id']) for r in rows])
+
+def get_resume_for_profile(resume_id):
+    sql = "SELECT id, user_email, resume_text, text_hash, profile_json, profile_hash FROM resumes WHERE id=?"
+    return execute_query(sql, (resume_id,), fetch_mode='one')
+
+def save_resume_profile(resume_id, source_hash, profile):
+    # Guarded by the hash so a profile extracted from old text never lands on a changed resume.
+    sql = """
+        UPDATE resumes SET profile_json=?, profile_hash=?, profile_updated_at=CURRENT_TIMESTAMP
+        WHERE id=? AND text_hash=?
+    """
+    execute_query(sql, (compact(profile), source_hash, resume_id, source_hash), commit=True)
+
+def get_resume_profile(user_email, resume_text=None):
+    # A profile only counts while profile_hash still matches the resume's current text_hash.
+    if resume_text:
+        sql = "SELECT profile_json FROM resumes WHERE user_email=? AND text_hash=? AND profile_hash=text_hash LIMIT 1"
+        params = (user_email, resume_text_hash(resume_text))
+    else:
+        sql = "SELECT profile_json FROM resumes WHERE user_email=? AND is_active=1 AND profile_hash=text_hash"
+        params = (user_email,)
+    res = execute_query(sql, params, fetch_mode='one')
+    if res and res['profile_json']:
+        return loads(res['profile_json'])
+    return None
+
+def _syllabus_days(syllabus):
+    weeks = None
+    if isinstance(syllabus, dict):
+        weeks = syllabus.get("weeks") or syllabus.get("Weeks") or syllabus.get("WEEKs")
+    if not isinstance(weeks, list):
+        return []
+
+    days = []
+    for w_pos, week in enumerate(weeks, start=1):
+        if not isinstance(week, dict): continue
+        week_num = week.get("week_number") or week.get("Week_Number") or week.get("Week") or w_pos
+        week_days = week.get("days") or week.get("Days") or []
+        for d_pos, day in enumerate(week_days, start=1):
+            if not isinstance(day, dict): continue
+            day_num = day.get("day_number") or day.get("Day_Number") or day.get("Day") or d_pos
+            title = day.get("title") or day.get("Title") or day.get("day_title")
+            days.append((int(week_num), int(day_num), title))
+    return days
+
+def _store_course_days(course_id, syllabus, completed=()):
+    rows = []
+    seen = set()
+    for week, day, title in _syllabus_days(syllabus):
+        if (week, day) in seen: continue
+        seen.add((week, day))
+        rows.append((course_id, week, day, title))
+
+    execute_many("INSERT INTO course_days (course_id, week_number, day_number, title) VALUES (?, ?, ?, ?)", rows)
+    for week, day in completed:
+        mark_course_day(course_id, week, day, refresh=False)
+    refresh_course_position(course_id)
+
+def backfill_course_days():
+    # Courses created before per-day tracking: seed their day rows and carry over completed_days_json.
+    execute_query("UPDATE course_progress SET unlocked_week=current_week WHERE unlocked_week IS NULL OR unlocked_week<current_week", commit=True)
+    sql = """
+        SELECT c.id, CAST(c.syllabus_json AS TEXT) AS syllabus_json, p.completed_days_json
+        FROM courses c
+        JOIN course_progress p ON c.id = p.course_id
+        WHERE NOT EXISTS (SELECT 1 FROM course_days d WHERE d.course_id = c.id)
+    """
+    rows = execute_query(sql, fetch_mode='all') or []
+    for row in rows:
+        try:
+            completed = []
+            for key in loads(row['completed_days_json'] or '[]'):
+                week, day = str(key).split("-", 1)
+                completed.append((int(week), int(day)))
+            _store_course_days(row['id'], loads(row['syllabus_json']), completed)
+        except Exception as e:
+            log.error("Course day backfill error (%s): %s", row['id'], e)
+
+COURSE_DESCRIPTION_CHARS = 200
+
+def _course_summary(syllabus):
+    # What a course card needs, computed once so listing courses never has to read the syllabus.
+    days = {(week, day) for week, day, _ in _syllabus_days(syllabus)}
+    syllabus = syllabus if isinstance(syllabus, dict) else {}
+    title = syllabus.get("course_title") or syllabus.get("title") or syllabus.get("Title")
+    description = syllabus.get("description") or syllabus.get("Description") or ""
+    return (
+        str(title)[:COURSE_DESCRIPTION_CHARS] if title else None,
+        str(description)[:COURSE_DESCRIPTION_CHARS],
+        len({week for week, _ in days}),
+        len(days),
+    )
+
+def backfill_course_summaries(batch_size=200):
+    while True:
+        rows = execute_query(
+            "SELECT id, CAST(syllabus_json AS TEXT) AS syllabus_json FROM courses WHERE total_days IS NULL LIMIT ?",
+            (batch_size,), fetch_mode='all'
+        ) or []
+        updates = []
+        for row in rows:
+            try:
+                summary = _course_summary(loads(row['syllabus_json']))
+            except Exception:
+                summary = (None, "", 0, 0)
+            updates.append(summary + (row['id'],))
+        if not updates or not execute_many("UPDATE courses SET title=?, description=?, total_weeks=?, total_days=? WHERE id=?", updates):
+            return
+        log.info("Backfilled %d course summaries", len(updates))
+
 def create_course(user_email, topic, syllabus_json):
-    sql = "INSERT INTO courses (user_email, topic, syllabus_json) VALUES (?, ?, ?)"
+    sql = "INSERT INTO courses (user_email, topic, syllabus_json, title, description, total_weeks, total_days) VALUES (?, ?, ?, ?, ?, ?, ?)"
     try:
-        course_id = execute_insert_returning_id(sql, (user_email, topic, syllabus_json))
+        syllabus = loads(syllabus_json) if isinstance(syllabus_json, (str, bytes)) else syllabus_json
+        course_id = execute_insert_returning_id(sql, (user_email, topic, compact(syllabus)) + _course_summary(syllabus))
         
         if course_id:
             execute_query("INSERT INTO course_progress (user_email, course_id) VALUES (?, ?)", (user_email, course_id), commit=True)
+            _store_course_days(course_id, syllabus)
             return course_id
         return None
     except Exception as e:
-        print(f"Create Course Error: {e}")
+        log.error("Create course error: %s", e)
         return None
 
-def get_user_courses(user_email):
+COURSE_AGGREGATES_SQL = """
+    SELECT course_id, COUNT(*) AS total_days, COUNT(completed_at) AS completed_count
+    FROM course_days
+    WHERE course_id IN ({courses})
+    GROUP BY course_id
+"""
+
+def list_user_courses(user_email, limit=20, offset=0):
+    # Card view: summary columns only, one page at a time, never the syllabus.
     sql = """
-        SELECT c.id, c.topic, c.syllabus_json, c.created_at, 
-               p.current_week, p.current_day, p.is_completed 
-        FROM courses c 
-        JOIN course_progress p ON c.id = p.course_id 
-        WHERE c.user_email = ? 
-        ORDER BY c.created_at DESC
+        SELECT c.id, c.topic, c.title, c.description, c.total_weeks, c.total_days, c.created_at,
+               p.current_week, p.current_day, p.is_completed,
+               COALESCE(d.completed_count, 0) AS completed_count,
+               d.last_completed_at,
+               CASE WHEN c.total_days > 0 THEN (100 * COALESCE(d.completed_count, 0)) / c.total_days ELSE 0 END AS completion_percent,
+               COUNT(*) OVER () AS total
+        FROM courses c
+        JOIN course_progress p ON c.id = p.course_id
+        LEFT JOIN (
+            SELECT course_id, COUNT(*) AS completed_count, MAX(completed_at) AS last_completed_at
+            FROM course_days
+            WHERE completed_at IS NOT NULL AND course_id IN (SELECT id FROM courses WHERE user_email = ?)
+            GROUP BY course_id
+        ) d ON d.course_id = c.id
+        WHERE c.user_email = ?
+        ORDER BY c.created_at DESC, c.id DESC
+        LIMIT ? OFFSET ?
     """
-    res = execute_query(sql, (user_email,), fetch_mode='all')
-    return res if res else []
+    rows = [dict(r) for r in execute_query(sql, (user_email, user_email, limit, offset), fetch_mode='all') or []]
+    if rows:
+        total = rows[0]['total']
+    elif offset:
+        # A page past the end has no row to carry the window count.
+        res = execute_query(
+            "SELECT COUNT(*) AS total FROM courses c JOIN course_progress p ON c.id = p.course_id WHERE c.user_email = ?",
+            (user_email,), fetch_mode='one'
+        )
+        total = res['total'] if res else 0
+    else:
+        total = 0
+    for row in rows:
+        del row['total']
+        row['is_completed'] = bool(row['is_completed'])
+    return rows, total
 
 def get_course_details(course_id):
-    sql = """
-        SELECT c.*, p.current_week, p.current_day, p.completed_days_json, p.is_completed 
+    sql = f"""
+        SELECT c.id, c.user_email, c.topic, CAST(c.syllabus_json AS TEXT) AS syllabus_json, c.created_at,
+               p.current_week, p.current_day, p.unlocked_week, p.is_completed,
+               COALESCE(d.total_days, 0) AS total_days,
+               COALESCE(d.completed_count, 0) AS completed_count,
+               CASE WHEN d.total_days > 0 THEN (100 * d.completed_count) / d.total_days ELSE 0 END AS completion_percent
         FROM courses c 
         JOIN course_progress p ON c.id = p.course_id 
+        LEFT JOIN ({COURSE_AGGREGATES_SQL.format(courses="?")}) d ON d.course_id = c.id
         WHERE c.id = ?
     """
-    return execute_query(sql, (course_id,), fetch_mode='one')
+    return execute_query(sql, (course_id, course_id), fetch_mode='one')
+
+def get_course_day_keys(course_id):
+    res = execute_query("SELECT week_number, day_number FROM course_days WHERE course_id=?", (course_id,), fetch_mode='all')
+    return {(r['week_number'], r['day_number']) for r in res or []}
+
+def get_completed_days(course_id):
+    sql = "SELECT week_number, day_number FROM course_days WHERE course_id=? AND completed_at IS NOT NULL ORDER BY week_number, day_number"
+    res = execute_query(sql, (course_id,), fetch_mode='all')
+    return [f"{r['week_number']}-{r['day_number']}" for r in res] if res else []
 
 def save_day_content(course_id, week, day, content):
-    sql = "INSERT INTO course_content (course_id, week_number, day_number, content_markdown) VALUES (?, ?, ?, ?)"
-    execute_query(sql, (course_id, week, day, content), commit=True)
+    # Rendered once here so readers get ready HTML instead of converting markdown on every open.
+    sql = """
+        INSERT INTO course_content (course_id, week_number, day_number, content_markdown, content_html, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+    execute_query(sql, (course_id, week, day, content, render_lesson(content), content_hash(content)), commit=True)
+    doc = _lesson_document(course_id, week, day, content)
+    if doc:
+        index_documents([doc])
 
 def get_day_content(course_id, week, day):
     sql = "SELECT content_markdown FROM course_content WHERE course_id=? AND week_number=? AND day_number=?"
     res = execute_query(sql, (course_id, week, day), fetch_mode='one')
     return res['content_markdown'] if res else None
 
-def update_course_progress(course_id, week, day, completed_days):
-    sql = "UPDATE course_progress SET current_week=?, current_day=?, completed_days_json=? WHERE course_id=?"
-    execute_query(sql, (week, day, completed_days, course_id), commit=True)
+def get_day_content_hash(course_id, week, day):
+    sql = "SELECT content_hash FROM course_content WHERE course_id=? AND week_number=? AND day_number=?"
+    res = execute_query(sql, (course_id, week, day), fetch_mode='one')
+    return res['content_hash'] if res else None
+
+def get_rendered_day_content(course_id, week, day):
+    # Returns {markdown, html, hash}; rows stored before rendering existed (or by an older
+    # renderer) are rendered on first read and written back.
+    sql = """
+        SELECT id, content_markdown, content_html, content_hash FROM course_content
+        WHERE course_id=? AND week_number=? AND day_number=?
+    """
+    res = execute_query(sql, (course_id, week, day), fetch_mode='one')
+    if not res:
+        return None
+
+    lesson = {"markdown": res['content_markdown'], "html": res['content_html'], "hash": res['content_hash']}
+    if not is_current(lesson["hash"]):
+        lesson["html"] = render_lesson(lesson["markdown"])
+        lesson["hash"] = content_hash(lesson["markdown"])
+        execute_query(
+            "UPDATE course_content SET content_html=?, content_hash=? WHERE id=?",
+            (lesson["html"], lesson["hash"], res['id']), commit=True
+        )
+    return lesson
+
+def mark_course_day(course_id, week, day, completed=True, refresh=True):
+    if completed:
+        sql = "UPDATE course_days SET completed_at=CURRENT_TIMESTAMP WHERE course_id=? AND week_number=? AND day_number=? AND completed_at IS NULL"
+    else:
+        sql = "UPDATE course_days SET completed_at=NULL WHERE course_id=? AND week_number=? AND day_number=?"
+    execute_query(sql, (course_id, week, day), commit=True)
+    if refresh:
+        refresh_course_position(course_id)
+
+def unlock_course_week(course_id, week):
+    sql = "UPDATE course_progress SET unlocked_week=? WHERE course_id=? AND unlocked_week<?"
+    execute_query(sql, (week, course_id, week), commit=True)
+    refresh_course_position(course_id)
+
+def refresh_course_position(course_id):
+    # Current position = first unfinished day inside the weeks unlocked so far.
+    progress = execute_query("SELECT unlocked_week FROM course_progress WHERE course_id=?", (course_id,), fetch_mode='one')
+    if not progress:
+        return
+    unlocked_week = progress['unlocked_week'] or 1
+
+    position = execute_query(
+        "SELECT week_number, day_number FROM course_days WHERE course_id=? AND completed_at IS NULL AND week_number<=? ORDER BY week_number, day_number LIMIT 1",
+        (course_id, unlocked_week), fetch_mode='one'
+    )
+    if not position:
+        position = execute_query(
+            "SELECT week_number, day_number FROM course_days WHERE course_id=? AND week_number<=? ORDER BY week_number DESC, day_number DESC LIMIT 1",
+            (course_id, unlocked_week), fetch_mode='one'
+        )
+    remaining = execute_query(
+        "SELECT COUNT(*) AS n FROM course_days WHERE course_id=? AND completed_at IS NULL",
+        (course_id,), fetch_mode='one'
+    )
+
+    week = position['week_number'] if position else unlocked_week
+    day = position['day_number'] if position else 1
+    is_completed = bool(position) and remaining['n'] == 0
+    execute_query(
+        "UPDATE course_progress SET current_week=?, current_day=?, is_completed=? WHERE course_id=?",
+        (week, day, is_completed, course_id), commit=True
+    )
+
+def _normalize_roadmap(roadmap):
+    phases = roadmap.get("phases") if isinstance(roadmap, dict) else None
+    if not isinstance(phases, list):
+        return roadmap, [], []
+
+    outline = {k: v for k, v in roadmap.items() if k != "phases"}
+    outline["phases"] = []
+    weeks, days = [], []
+
+    for phase_index, phase in enumerate(phases, start=1):
+        phase = phase if isinstance(phase, dict) else {}
+        phase_weeks = phase.get("weeks") if isinstance(phase.get("weeks"), list) else []
+        first_week = len(weeks) + 1
+
+        for week in phase_weeks:
+            week = week if isinstance(week, dict) else {}
+            week_index = len(weeks) + 1
+            weeks.append((phase_index, week_index, week.get("week_number"), week.get("week_title")))
+
+            week_days = week.get("days") if isinstance(week.get("days"), list) else []
+            for day in week_days:
+                day = day if isinstance(day, dict) else {}
+                days.append((week_index, len(days) + 1, day.get("day_number"), compact(day.get("topics") or [])))
+
+        summary = {k: v for k, v in phase.items() if k != "weeks"}
+        summary.update({
+            "phase_index": phase_index,
+            "week_count": len(phase_weeks),
+            "first_week": first_week,
+            "last_week": len(weeks)
+        })
+        outline["phases"].append(summary)
+
+    outline["total_weeks"] = len(weeks)
+    outline["total_days"] = len(days)
+    return outline, weeks, days
+
+def _store_roadmap_rows(roadmap_id, weeks, days):
+    weeks_ok = execute_many(
+        "INSERT INTO roadmap_weeks (roadmap_id, phase_index, week_index, week_number, week_title) VALUES (?, ?, ?, ?, ?)",
+        [(roadmap_id,) + w for w in weeks]
+    )
+    days_ok = execute_many(
+        "INSERT INTO roadmap_days (roadmap_id, week_index, day_index, day_number, topics_json) VALUES (?, ?, ?, ?, ?)",
+        [(roadmap_id,) + d for d in days]
+    )
+    return weeks_ok and days_ok
+
+def _delete_roadmap_rows(user_email):
+    for row in execute_query("SELECT id FROM roadmaps WHERE user_email=?", (user_email,), fetch_mode='all') or []:
+        remove_documents("roadmap", ref_prefix=f"{row['id']}:")
+    for table in ("roadmap_day_progress", "roadmap_days", "roadmap_weeks"):
+        execute_query(f"DELETE FROM {table} WHERE roadmap_id IN (SELECT id FROM roadmaps WHERE user_email=?)", (user_email,), commit=True)
+    execute_query("DELETE FROM roadmaps WHERE user_email=?", (user_email,), commit=True)
+
+@timed_phase("db")
+def _replace_roadmap(user_email, domain, outline, weeks, days):
+    # One transaction, so a failed insert leaves the previous roadmap in place.
+    # Returns (new id, ids of the roadmaps it replaced) or None.
+    conn = get_db_connection()
+    if not conn: return None
+
+    def run(sql, params=()):
+        cursor.execute(sql.replace("?", "%s") if DATABASE_URL else sql, params)
 
-def save_roadmap(user_email, domain, roadmap_json):
     try:
-        execute_query("DELETE FROM roadmaps WHERE user_email=?", (user_email,), commit=True)
+        cursor = conn.cursor()
+        run("SELECT id FROM roadmaps WHERE user_email=?", (user_email,))
+        old_ids = [row[0] for row in cursor.fetchall()]
+        for table in ("roadmap_day_progress", "roadmap_days", "roadmap_weeks"):
+            run(f"DELETE FROM {table} WHERE roadmap_id IN (SELECT id FROM roadmaps WHERE user_email=?)", (user_email,))
+        run("DELETE FROM roadmaps WHERE user_email=?", (user_email,))
+
         sql = "INSERT INTO roadmaps (user_email, domain, roadmap_json) VALUES (?, ?, ?)"
-        execute_query(sql, (user_email, domain, roadmap_json), commit=True)
-        return True
-    except:
+        if DATABASE_URL:
+            run(sql + " RETURNING id", (user_email, domain, compact(outline)))
+            roadmap_id = cursor.fetchone()[0]
+        else:
+            run(sql, (user_email, domain, compact(outline)))
+            roadmap_id = cursor.lastrowid
+
+        sql = "INSERT INTO roadmap_weeks (roadmap_id, phase_index, week_index, week_number, week_title) VALUES (?, ?, ?, ?, ?)"
+        cursor.executemany(sql.replace("?", "%s") if DATABASE_URL else sql, [(roadmap_id,) + w for w in weeks])
+        sql = "INSERT INTO roadmap_days (roadmap_id, week_index, day_index, day_number, topics_json) VALUES (?, ?, ?, ?, ?)"
+        cursor.executemany(sql.replace("?", "%s") if DATABASE_URL else sql, [(roadmap_id,) + d for d in days])
+        conn.commit()
+        return roadmap_id, old_ids
+    except Exception as e:
+        log.error("Save roadmap error: %s", e)
+        conn.rollback()
+        return None
+    finally:
+        release_connection(conn)
+
+def save_roadmap(user_email, domain, roadmap_json):
+    try:
+        roadmap = loads(roadmap_json) if isinstance(roadmap_json, (str, bytes)) else roadmap_json
+        outline, weeks, days = _normalize_roadmap(roadmap)
+    except Exception as e:
+        log.error("Save roadmap error: %s", e)
         return False
 
+    saved = _replace_roadmap(user_email, domain, outline, weeks, days)
+    if not saved:
+        return False
+    roadmap_id, old_ids = saved
+    for old_id in old_ids:
+        remove_documents("roadmap", ref_prefix=f"{old_id}:")
+    index_documents(_roadmap_day_documents(user_email, roadmap_id, domain, [d[1:] for d in days]))
+    return True
+
 def get_user_roadmap(user_email):
-    sql = "SELECT * FROM roadmaps WHERE user_email=? ORDER BY created_at DESC"
+    sql = "SELECT id, user_email, domain, CAST(roadmap_json AS TEXT) AS roadmap_json, created_at FROM roadmaps WHERE user_email=? ORDER BY created_at DESC"
     res = execute_query(sql, (user_email,), fetch_mode='one')
+    if res and '"weeks"' in res['roadmap_json']:
+        res = _migrate_legacy_roadmap(res)
     return res
 
+def _migrate_legacy_roadmap(row):
+    # Roadmaps saved before normalization still hold the whole document.
+    outline, weeks, days = _normalize_roadmap(loads(row['roadmap_json']))
+    if not weeks:
+        return row
+
+    execute_query("DELETE FROM roadmap_days WHERE roadmap_id=?", (row['id'],), commit=True)
+    execute_query("DELETE FROM roadmap_weeks WHERE roadmap_id=?", (row['id'],), commit=True)
+    if not _store_roadmap_rows(row['id'], weeks, days):
+        return row
+    index_documents(_roadmap_day_documents(row['user_email'], row['id'], row['domain'], [d[1:] for d in days]))
+
+    outline_json = compact(outline)
+    execute_query("UPDATE roadmaps SET roadmap_json=? WHERE id=?", (outline_json, row['id']), commit=True)
+    log.info("Normalized legacy roadmap %s", row['id'])
+    row = dict(row)
+    row['roadmap_json'] = outline_json
+    return row
+
+def get_roadmap_weeks(roadmap_id, phase_index=None, start_week=None, end_week=None):
+    where = "roadmap_id=?"
+    params = [roadmap_id]
+    if phase_index is not None:
+        where += " AND phase_index=?"
+        params.append(phase_index)
+    if start_week is not None:
+        where += " AND week_index>=?"
+        params.append(start_week)
+    if end_week is not None:
+        where += " AND week_index<=?"
+        params.append(end_week)
+
+    weeks = execute_query(
+        f"SELECT phase_index, week_index, week_number, week_title FROM roadmap_weeks WHERE {where} ORDER BY week_index",
+        tuple(params), fetch_mode='all'
+    ) or []
+    if not weeks:
+        return [], []
+
+    days = execute_query(
+        "SELECT week_index, day_index, day_number, topics_json FROM roadmap_days WHERE roadmap_id=? AND week_index BETWEEN ? AND ? ORDER BY day_index",
+        (roadmap_id, weeks[0]['week_index'], weeks[-1]['week_index']), fetch_mode='all'
+    ) or []
+    return weeks, days
+
+def update_roadmap_day(roadmap_id, day_index, topics):
+    # False when the roadmap has no such day, None when the update failed.
+    sql = "UPDATE roadmap_days SET topics_json=?, updated_at=CURRENT_TIMESTAMP WHERE roadmap_id=? AND day_index=?"
+    try:
+        counts = execute_transaction([(sql, (compact(topics), roadmap_id, day_index))])
+        if counts is None:
+            return None
+        if not counts[0]:
+            return False
+        row = execute_query(
+            "SELECT r.user_email, r.domain, d.day_number FROM roadmap_days d JOIN roadmaps r ON r.id = d.roadmap_id WHERE d.roadmap_id=? AND d.day_index=?",
+            (roadmap_id, day_index), fetch_mode='one'
+        )
+        if row:
+            index_documents(_roadmap_day_documents(row['user_email'], roadmap_id, row['domain'], [(day_index, row['day_number'], topics)]))
+        return True
+    except Exception as e:
+        log.error("Update roadmap day error: %s", e)
+        return None
+
+def set_roadmap_day_completed(roadmap_id, day_index, completed=True):
+    if completed:
+        sql = "INSERT INTO roadmap_day_progress (roadmap_id, day_index) VALUES (?, ?) ON CONFLICT (roadmap_id, day_index) DO NOTHING"
+    else:
+        sql = "DELETE FROM roadmap_day_progress WHERE roadmap_id=? AND day_index=?"
+    execute_query(sql, (roadmap_id, day_index), commit=True)
+
+def get_roadmap_completed_days(roadmap_id):
+    sql = "SELECT day_index FROM roadmap_day_progress WHERE roadmap_id=? ORDER BY day_index"
+    res = execute_query(sql, (roadmap_id,), fetch_mode='all')
+    return [r['day_index'] for r in res] if res else []
+
 def delete_roadmap(user_email):
-    sql = "DELETE FROM roadmaps WHERE user_email=?"
     try:
-        execute_query(sql, (user_email,), commit=True)
+        _delete_roadmap_rows(user_email)
         return True
     except:
         return False
 
+def create_search_tables():
+    if DATABASE_URL:
+        sql = """
+            CREATE TABLE IF NOT EXISTS search_documents (
+                id SERIAL PRIMARY KEY,
+                user_email TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                ref_id TEXT NOT NULL,
+                title TEXT,
+                body TEXT,
+                tsv TSVECTOR GENERATED ALWAYS AS (
+                    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(body, '')), 'B')
+                ) STORED,
+                UNIQUE (kind, ref_id)
+            )
+        """
+        execute_query(sql, commit=True)
+        execute_query("CREATE INDEX IF NOT EXISTS idx_search_documents_tsv ON search_documents USING GIN (tsv)", commit=True)
+        execute_query("CREATE INDEX IF NOT EXISTS idx_search_documents_user ON search_documents (user_email)", commit=True)
+    else:
+        refs_sql = """
+            CREATE TABLE IF NOT EXISTS search_refs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_email TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                ref_id TEXT NOT NULL,
+                title TEXT,
+                UNIQUE (kind, ref_id)
+            )
+        """
+        execute_query(refs_sql, commit=True)
+        execute_query("CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(title, body, tokenize='porter unicode61')", commit=True)
+
+def index_documents(docs):
+    # docs: (user_email, kind, ref_id, title, body) tuples; existing (kind, ref_id) entries are replaced.
+    docs = [(email, kind, str(ref), title or "", body or "") for email, kind, ref, title, body in docs]
+    if not docs:
+        return True
+
+    if DATABASE_URL:
+        sql = """
+            INSERT INTO search_documents (user_email, kind, ref_id, title, body) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (kind, ref_id) DO UPDATE SET user_email=EXCLUDED.user_email, title=EXCLUDED.title, body=EXCLUDED.body
+        """
+        return execute_many(sql, docs)
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        for email, kind, ref, title, body in docs:
+            cursor.execute("SELECT id FROM search_refs WHERE kind=? AND ref_id=?", (kind, ref))
+            existing = cursor.fetchone()
+            if existing:
+                cursor.execute("DELETE FROM search_fts WHERE rowid=?", (existing[0],))
+                cursor.execute("UPDATE search_refs SET user_email=?, title=? WHERE id=?", (email, title, existing[0]))
+                doc_id = existing[0]
+            else:
+                cursor.execute("INSERT INTO search_refs (user_email, kind, ref_id, title) VALUES (?, ?, ?, ?)", (email, kind, ref, title))
+                doc_id = cursor.lastrowid
+            cursor.execute("INSERT INTO search_fts (rowid, title, body) VALUES (?, ?, ?)", (doc_id, title, body))
+        conn.commit()
+        return True
+    except Exception as e:
+        log.error("Search index error: %s", e)
+        conn.rollback()
+        return False
+    finally:
+        release_connection(conn)
+
+def remove_documents(kind, ref_id=None, ref_prefix=None):
+    if ref_prefix is not None:
+        where, param = "kind=? AND ref_id LIKE ?", f"{ref_prefix}%"
+    else:
+        where, param = "kind=? AND ref_id=?", str(ref_id)
+
+    if DATABASE_URL:
+        execute_query(f"DELETE FROM search_documents WHERE {where}", (kind, param), commit=True)
+        return
+
+    execute_query(f"DELETE FROM search_fts WHERE rowid IN (SELECT id FROM search_refs WHERE {where})", (kind, param), commit=True)
+    execute_query(f"DELETE FROM search_refs WHERE {where}", (kind, param), commit=True)
+
+def _fts_query(query):
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        return None
+    # Quote every term so user input can't inject FTS5 syntax; the last one matches as a prefix.
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def _safe_snippet(snippet):
+    return html.escape(snippet or "").replace("&lt;mark&gt;", "<mark>").replace("&lt;/mark&gt;", "</mark>")
+
+def search_documents(user_email, query, kind=None, limit=10, offset=0):
+    kind_filter = " AND kind=?" if kind else ""
+    kind_params = (kind,) if kind else ()
+
+    if DATABASE_URL:
+        sql = f"""
+            SELECT kind, ref_id, title,
+                   ts_headline('english', coalesce(body, ''), q, 'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=8') AS snippet,
+                   ts_rank_cd(tsv, q) AS score,
+                   COUNT(*) OVER () AS total
+            FROM search_documents, websearch_to_tsquery('english', ?) q
+            WHERE user_email=? AND tsv @@ q{kind_filter}
+            ORDER BY score DESC
+            LIMIT ? OFFSET ?
+        """
+        params = (query, user_email) + kind_params + (limit, offset)
+    else:
+        match = _fts_query(query)
+        if not match:
+            return [], 0
+        base = f"""
+            FROM search_fts
+            JOIN search_refs r ON r.id = search_fts.rowid
+            WHERE search_fts MATCH ? AND r.user_email=?{kind_filter.replace("kind", "r.kind")}
+        """
+        count = execute_query(f"SELECT COUNT(*) AS total {base}", (match, user_email) + kind_params, fetch_mode='one')
+        sql = f"""
+            SELECT r.kind, r.ref_id, r.title,
+                   snippet(search_fts, 1, '<mark>', '</mark>', '…', 16) AS snippet,
+                   bm25(search_fts, 5.0, 1.0) AS score,
+                   ? AS total
+            {base}
+            ORDER BY score
+            LIMIT ? OFFSET ?
+        """
+        params = (count['total'] if count else 0, match, user_email) + kind_params + (limit, offset)
+
+    rows = execute_query(sql, params, fetch_mode='all') or []
+    total = rows[0]['total'] if rows else 0
+    results = [{
+        "kind": r['kind'],
+        "ref_id": r['ref_id'],
+        "title": r['title'],
+        "snippet": _safe_snippet(r['snippet'])
+    } for r in rows]
+    return results, total
+
+def _lesson_document(course_id, week, day, content):
+    row = execute_query(
+        "SELECT c.user_email, c.topic, d.title FROM courses c LEFT JOIN course_days d ON d.course_id=c.id AND d.week_number=? AND d.day_number=? WHERE c.id=?",
+        (week, day, course_id), fetch_mode='one'
+    )
+    if not row:
+        return None
+    title = f"{row['topic']} · Week {week} Day {day}" + (f": {row['title']}" if row['title'] else "")
+    return (row['user_email'], "lesson", f"{course_id}:{week}:{day}", title, content)
+
+def _roadmap_day_documents(user_email, roadmap_id, domain, days):
+    docs = []
+    for day_index, day_number, topics_json in days:
+        topics = loads(topics_json) if isinstance(topics_json, str) else topics_json
+        topics = [t for t in topics or [] if isinstance(t, dict)]
+        names = ", ".join(str(t.get("topic_name", "")) for t in topics)
+        body = "\n".join(" ".join(str(t.get(k, "")) for k in ("topic_name", "explanation", "practice")) for t in topics)
+        docs.append((user_email, "roadmap", f"{roadmap_id}:{day_index}", f"{domain} · Day {day_number}: {names}", body))
+    return docs
+
+def _ref_expr(*columns):
+    return " || ':' || ".join(f"CAST({c} AS TEXT)" for c in columns)
+
+def backfill_search_index():
+    table = "search_documents" if DATABASE_URL else "search_refs"
+    indexed = f"EXISTS (SELECT 1 FROM {table} s WHERE s.kind=? AND s.ref_id={{ref}})"
+
+    resumes = execute_query(
+        f"SELECT id, user_email, filename, resume_text FROM resumes r WHERE NOT {indexed.format(ref=_ref_expr('r.id'))}",
+        ("resume",), fetch_mode='all'
+    ) or []
+    index_documents((r['user_email'], "resume", r['id'], r['filename'], r['resume_text']) for r in resumes)
+
+    lessons = execute_query(
+        f"SELECT course_id, week_number, day_number, content_markdown FROM course_content cc WHERE NOT {indexed.format(ref=_ref_expr('cc.course_id', 'cc.week_number', 'cc.day_number'))}",
+        ("lesson",), fetch_mode='all'
+    ) or []
+    index_documents(filter(None, (_lesson_document(l['course_id'], l['week_number'], l['day_number'], l['content_markdown']) for l in lessons)))
+
+    days = execute_query(
+        f"""SELECT r.id AS roadmap_id, r.user_email, r.domain, d.day_index, d.day_number, d.topics_json
+            FROM roadmap_days d JOIN roadmaps r ON r.id = d.roadmap_id
+            WHERE NOT {indexed.format(ref=_ref_expr('d.roadmap_id', 'd.day_index'))}""",
+        ("roadmap",), fetch_mode='all'
+    ) or []
+    docs = []
+    for d in days:
+        docs += _roadmap_day_documents(d['user_email'], d['roadmap_id'], d['domain'], [(d['day_index'], d['day_number'], d['topics_json'])])
+    index_documents(docs)
+
+    if resumes or lessons or days:
+        log.info("Search index backfilled: %d resumes, %d lessons, %d roadmap days", len(resumes), len(lessons), len(days))
+
+def create_ai_cache_tables():
+    # Requests per topic per UTC day, so "trending" is just a sum over recent days.
+    popularity_sql = """
+        CREATE TABLE IF NOT EXISTS topic_popularity (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            topic_key TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            day TEXT NOT NULL,
+            requests INTEGER DEFAULT 0,
+            UNIQUE (kind, topic_key, day)
+        )
+    """
+    execute_query(popularity_sql, commit=True)
+
+    # Last good syllabus, roadmap, lesson and quiz per topic. An entry generated ahead of demand
+    # (served_at NULL) is handed to one request; after that it is only an outage fallback.
+    cache_sql = """
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            cache_key TEXT NOT NULL,
+            content TEXT NOT NULL,
+            source TEXT,
+            hits INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            served_at TIMESTAMP,
+            UNIQUE (kind, cache_key)
+        )
+    """
+    execute_query(cache_sql, commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_topic_popularity_day ON topic_popularity (kind, day)", commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_ai_cache_created ON ai_cache (created_at)", commit=True)
+
+def record_topic_request(kind, topic_key, topic, day):
+    sql = """
+        INSERT INTO topic_popularity (kind, topic_key, topic, day, requests) VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT (kind, topic_key, day) DO UPDATE SET requests = topic_popularity.requests + 1
+    """
+    execute_query(sql, (kind, topic_key, topic, day), commit=True)
+
+def get_trending_topics(kind, since_day, min_requests=1, limit=10):
+    sql = """
+        SELECT topic_key, MAX(topic) AS topic, SUM(requests) AS requests
+        FROM topic_popularity
+        WHERE kind = ? AND day >= ?
+        GROUP BY topic_key
+        HAVING SUM(requests) >= ?
+        ORDER BY requests DESC
+        LIMIT ?
+    """
+    return execute_query(sql, (kind, since_day, min_requests, limit), fetch_mode='all') or []
+
+def purge_topic_popularity(before_day):
+    execute_query("DELETE FROM topic_popularity WHERE day < ?", (before_day,), commit=True)
+
+def get_ai_cache(kind, cache_key, created_after, count_hit=True):
+    row = execute_query(
+        "SELECT id, content FROM ai_cache WHERE kind = ? AND cache_key = ? AND created_at >= ?",
+        (kind, cache_key, created_after), fetch_mode='one'
+    )
+    if not row:
+        return None
+    if count_hit:
+        execute_query("UPDATE ai_cache SET hits = hits + 1 WHERE id = ?", (row['id'],), commit=True)
+    return row['content']
+
+def take_ai_cache(kind, cache_key, created_after):
+    # Marks an unserved entry as served as it is read, so no two requests get the same one.
+    row = execute_query(
+        "SELECT id, content FROM ai_cache WHERE kind = ? AND cache_key = ? AND created_at >= ? AND served_at IS NULL",
+        (kind, cache_key, created_after), fetch_mode='one'
+    )
+    if not row:
+        return None
+    counts = execute_transaction([(
+        "UPDATE ai_cache SET served_at = CURRENT_TIMESTAMP, hits = hits + 1 WHERE id = ? AND served_at IS NULL",
+        (row['id'],)
+    )])
+    return row['content'] if counts and counts[0] else None
+
+def has_ai_cache(kind, cache_key, created_after):
+    # Whether an unserved entry is waiting, i.e. prewarming this key would add nothing.
+    return bool(execute_query(
+        "SELECT id FROM ai_cache WHERE kind = ? AND cache_key = ? AND created_at >= ? AND served_at IS NULL",
+        (kind, cache_key, created_after), fetch_mode='one'
+    ))
+
+def put_ai_cache(kind, cache_key, content, source, created_at, served_at=None):
+    sql = """
+        INSERT INTO ai_cache (kind, cache_key, content, source, created_at, served_at) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (kind, cache_key) DO UPDATE SET content = EXCLUDED.content, source = EXCLUDED.source,
+            created_at = EXCLUDED.created_at, served_at = EXCLUDED.served_at, hits = 0
+    """
+    execute_query(sql, (kind, cache_key, content, source, created_at, served_at), commit=True)
+
+def purge_ai_cache(created_before):
+    execute_query("DELETE FROM ai_cache WHERE created_at < ?", (created_before,), commit=True)
+
+def get_ai_cache_stats():
+    sql = """
+        SELECT kind, source, COUNT(*) AS entries, SUM(hits) AS hits,
+               SUM(CASE WHEN served_at IS NULL THEN 1 ELSE 0 END) AS unserved
+        FROM ai_cache GROUP BY kind, source
+    """
+    return [dict(r) for r in execute_query(sql, fetch_mode='all') or []]
+
 def migrate_notifications_schema():
     migrate_columns()
 def migrate_users_schema():
@@ -0,0 +1,241 @@
+import os
+import re
+import html
+import time
+import socket
+import smtplib
+from email.policy import SMTP as SMTP_POLICY
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.utils import formataddr, make_msgid
+from database import get_digest_batch, mark_notifications_emailed
+from app_logging import get_logger, setup_logging
+
+log = get_logger("digest")
+
+SMTP_HOST = os.environ.get("SMTP_HOST")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_USER = os.environ.get("SMTP_USER")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_SSL = os.environ.get("SMTP_SSL", "false").lower() == "true"
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 30))
+
+DIGEST_FROM = os.environ.get("DIGEST_FROM", SMTP_USER or "alerts@jyomarg.local")
+DIGEST_INTERVAL = int(os.environ.get("DIGEST_INTERVAL", 3600))
+DIGEST_BATCH_SIZE = int(os.environ.get("DIGEST_BATCH_SIZE", 50))
+DIGEST_MAX_USERS = int(os.environ.get("DIGEST_MAX_USERS", 500))
+DIGEST_MAX_ITEMS = int(os.environ.get("DIGEST_MAX_ITEMS", 10))
+DIGEST_RATE = float(os.environ.get("DIGEST_RATE", 5))
+DIGEST_MAX_RETRIES = int(os.environ.get("DIGEST_MAX_RETRIES", 3))
+APP_URL = os.environ.get("APP_URL", "https://jyomarg-1.onrender.com")
+
+# Connection-level failures: reconnect and try the same message again.
+_DISCONNECTS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout)
+
+
+class PermanentSendError(Exception):
+    pass
+
+
+def render_digest(digest):
+    items = digest["items"]
+    extra = len(digest["ids"]) - len(items)
+    name = digest.get("name") or "there"
+
+    text_lines = [f"Hi {name},", "", f"You have {len(digest['ids'])} new job alerts on JYOMARG:", ""]
+    html_rows = []
+    for item in items:
+        link = item.get("apply_link") or "#"
+        text_lines.append(f"- {item['job_title']} at {item['company']} ({item['match_score'] or 0}% match)")
+        if item.get("reason"):
+            text_lines.append(f"  {item['reason']}")
+        if link != "#":
+            text_lines.append(f"  {link}")
+        html_rows.append(
+            "<tr><td style='padding:8px 0'>"
+            f"<a href='{html.escape(link, quote=True)}'><b>{html.escape(item['job_title'])}</b></a>"
+            f" at {html.escape(item['company'])} &middot; {int(item['match_score'] or 0)}% match"
+            f"<br><span style='color:#666'>{html.escape(item.get('reason') or '')}</span></td></tr>"
+        )
+    if extra > 0:
+        text_lines.append(f"...and {extra} more.")
+        html_rows.append(f"<tr><td>...and {extra} more.</td></tr>")
+    text_lines += ["", f"See all alerts: {APP_URL}/profile"]
+
+    message = MIMEMultipart("alternative")
+    message["Subject"] = f"{len(digest['ids'])} new job alerts for you"
+    message["From"] = DIGEST_FROM
+    message["To"] = formataddr((digest.get("name") or "", digest["email"]))
+    message["Message-ID"] = make_msgid(domain=DIGEST_FROM.split("@")[-1])
+    message.attach(MIMEText("\n".join(text_lines), "plain", "utf-8"))
+    message.attach(MIMEText(
+        f"<p>Hi {html.escape(name)},</p><p>You have {len(digest['ids'])} new job alerts:</p>"
+        f"<table>{''.join(html_rows)}</table>"
+        f"<p><a href='{html.escape(APP_URL)}/profile'>See all alerts</a></p>",
+        "html", "utf-8"
+    ))
+    return message
+
+
+class SMTPBatchSender:
+    # One SMTP session reused for a whole batch. When the server advertises PIPELINING,
+    # MAIL FROM, RCPT TO and DATA go out in a single write instead of three round trips.
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, username=SMTP_USER, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS, ssl=SMTP_SSL, rate=DIGEST_RATE, max_retries=DIGEST_MAX_RETRIES,
+                 timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.ssl = ssl
+        self.min_interval = 1.0 / rate if rate > 0 else 0
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.retries = 0
+        self._conn = None
+        self._next_send = 0.0
+
+    def __enter__(self):
+        self._connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        self.close()
+        factory = smtplib.SMTP_SSL if self.ssl else smtplib.SMTP
+        conn = factory(self.host, self.port, timeout=self.timeout)
+        conn.ehlo()
+        if self.starttls and not self.ssl and conn.has_extn("starttls"):
+            conn.starttls()
+            conn.ehlo()
+        if self.username:
+            conn.login(self.username, self.password or "")
+        self._conn = conn
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _throttle(self):
+        now = time.monotonic()
+        if now < self._next_send:
+            time.sleep(self._next_send - now)
+            now = self._next_send
+        self._next_send = now + self.min_interval
+
+    def _send_pipelined(self, sender, recipient, data):
+        conn = self._conn
+        conn.send(f"MAIL FROM:<{sender}>\r\nRCPT TO:<{recipient}>\r\nDATA\r\n")
+        mail_reply, rcpt_reply, data_reply = conn.getreply(), conn.getreply(), conn.getreply()
+
+        if data_reply[0] == 354 and (mail_reply[0] != 250 or rcpt_reply[0] not in (250, 251)):
+            # The server accepted DATA despite a refused envelope; finish the empty message and reset.
+            conn.send(".\r\n")
+            conn.getreply()
+        for code, text in (mail_reply, rcpt_reply, data_reply):
+            if code not in (250, 251, 354):
+                conn.rset()
+                raise smtplib.SMTPResponseException(code, text)
+
+        data = re.sub(rb"(?m)^\.", b"..", data)
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+        conn.send(data + b".\r\n")
+        code, text = conn.getreply()
+        if code != 250:
+            raise smtplib.SMTPResponseException(code, text)
+
+    def _send_once(self, message, recipient):
+        if self._conn is None:
+            self._connect()
+        if self._conn.does_esmtp and self._conn.has_extn("pipelining"):
+            self._send_pipelined(DIGEST_FROM, recipient, message.as_bytes(policy=SMTP_POLICY))
+        else:
+            self._conn.send_message(message, DIGEST_FROM, [recipient])
+
+    def send(self, message, recipient):
+        for attempt in range(self.max_retries + 1):
+            self._throttle()
+            try:
+                self._send_once(message, recipient)
+                return
+            except _DISCONNECTS as e:
+                error = e
+                self.close()
+            except smtplib.SMTPResponseException as e:
+                if not 400 <= e.smtp_code < 500:
+                    raise PermanentSendError(f"{e.smtp_code} {e.smtp_error!r}")
+                error = e
+            except smtplib.SMTPRecipientsRefused as e:
+                codes = [code for code, _ in e.recipients.values()]
+                if not all(400 <= code < 500 for code in codes):
+                    raise PermanentSendError(f"recipient refused: {codes}")
+                error = e
+
+            if attempt < self.max_retries:
+                self.retries += 1
+                wait = 2 ** attempt
+                log.warning("Transient failure (%s); retrying in %ds", error, wait)
+                time.sleep(wait)
+        raise error
+
+
+def send_digests(sender_factory=SMTPBatchSender):
+    digests = get_digest_batch(DIGEST_MAX_USERS, DIGEST_MAX_ITEMS)
+    if not digests:
+        return None
+
+    stats = {"users": len(digests), "sent": 0, "rejected": 0, "failed": 0, "retries": 0, "batches": []}
+    for start in range(0, len(digests), DIGEST_BATCH_SIZE):
+        batch = digests[start:start + DIGEST_BATCH_SIZE]
+        batch_stats = {"size": len(batch), "sent": 0, "rejected": 0, "failed": 0}
+        delivered = []
+        began = time.perf_counter()
+        try:
+            with sender_factory() as sender:
+                for digest in batch:
+                    try:
+                        sender.send(render_digest(digest), digest["email"])
+                        batch_stats["sent"] += 1
+                        delivered += digest["ids"]
+                    except PermanentSendError as e:
+                        # Retrying a refused address would fail the same way every run.
+                        log.warning("Rejected recipient: %s", e)
+                        batch_stats["rejected"] += 1
+                        delivered += digest["ids"]
+                    except Exception as e:
+                        log.error("Send failed: %s", e)
+                        batch_stats["failed"] += 1
+                stats["retries"] += sender.retries
+        except Exception as e:
+            log.error("SMTP session error: %s", e)
+            batch_stats["failed"] = batch_stats["size"] - batch_stats["sent"] - batch_stats["rejected"]
+
+        mark_notifications_emailed(delivered)
+        elapsed = time.perf_counter() - began
+        batch_stats["seconds"] = round(elapsed, 3)
+        batch_stats["per_second"] = round(batch_stats["sent"] / elapsed, 2) if elapsed else None
+        for key in ("sent", "rejected", "failed"):
+            stats[key] += batch_stats[key]
+        stats["batches"].append(batch_stats)
+        log.info("Batch %d sent", len(stats['batches']), extra=batch_stats)
+
+    stats["processed"] = stats["sent"]
+    return stats
+
+
+if __name__ == "__main__":
+    # Manual run, e.g. against a local stand-in:
+    #   python -m aiosmtpd -n -l localhost:1025 &
+    #   SMTP_HOST=localhost SMTP_PORT=1025 SMTP_STARTTLS=false python digest.py
+    setup_logging()
+    print(send_digests())
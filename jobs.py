@@ -0,0 +1,83 @@
+import time
+import asyncio
+from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+from database import record_job_run
+from app_logging import get_logger, request_id_var
+
+log = get_logger("jobs")
+
+
+class PeriodicJob:
+    # Runs a blocking function in the threadpool every `interval` seconds and records each run.
+    # The function returns a stats dict; its "processed" entry is stored in its own column.
+    # Returning None means there was nothing to do, and the run is not recorded.
+
+    def __init__(self, name, func, interval, initial_delay=30):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.runs = 0
+        self.last_status = None
+        self.last_stats = None
+        self.last_run_at = None
+        self._task = None
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def run_once(self):
+        started_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        # Each run gets its own correlation id, like a request.
+        token = request_id_var.set(f"job-{self.name}-{self.runs + 1}")
+        try:
+            return self._run(started_at)
+        finally:
+            request_id_var.reset(token)
+
+    def _run(self, started_at):
+        start = time.perf_counter()
+        stats, status, error = {}, "ok", None
+        try:
+            stats = self.func()
+            if stats is None:
+                return None
+        except Exception as e:
+            stats, status, error = {}, "error", str(e)
+            log.exception("%s failed", self.name)
+
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        self.runs += 1
+        self.last_status = status
+        self.last_stats = stats
+        self.last_run_at = started_at
+        record_job_run(self.name, status, started_at, duration_ms, stats.get("processed", 0), stats, error)
+        log.info("%s: %s in %dms", self.name, status, duration_ms, extra={"job": self.name, "duration_ms": duration_ms, "stats": stats})
+        return stats
+
+    async def _loop(self):
+        await asyncio.sleep(self.initial_delay)
+        while True:
+            await run_in_threadpool(self.run_once)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "interval": self.interval,
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_status": self.last_status,
+            "last_stats": self.last_stats,
+        }
@@ -0,0 +1,182 @@
+import json
+
+_WHITESPACE = " \t\r\n"
+_SCALAR_CHARS = set("-+.0123456789eEtruefalsn")
+
+
+class JSONStreamError(ValueError):
+    def __init__(self, message, position):
+        super().__init__(f"{message} at char {position}")
+        self.position = position
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "state", "key", "index")
+
+    def __init__(self, kind, path):
+        self.kind = kind
+        self.path = path
+        self.state = "first"
+        self.key = None
+        self.index = 0
+
+
+class IncrementalJSONParser:
+    # Checks JSON text as it streams in so a broken response can be abandoned early,
+    # and returns each element of the array at `item_path` as soon as it closes.
+
+    def __init__(self, item_path=None):
+        if isinstance(item_path, str):
+            item_path = tuple(p for p in item_path.split(".") if p)
+        self.item_path = tuple(item_path) if item_path is not None else None
+        self._buffer = ""
+        self._pos = 0
+        self._stack = []
+        self._started = False
+        self._done = False
+        self._in_fence = False
+        self._token = None
+        self._token_start = 0
+        self._escape = False
+        self._capture = None
+
+    @property
+    def done(self):
+        return self._done
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        items = []
+        while self._pos < len(self._buffer):
+            self._step(self._buffer[self._pos], self._pos, items)
+            self._pos += 1
+        return items
+
+    def close(self):
+        if not self._done:
+            raise JSONStreamError("Unexpected end of JSON", len(self._buffer))
+        text = self._buffer.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+        return json.loads(text.rstrip("`"))
+
+    def _step(self, ch, i, items):
+        if self._token == "string":
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._token = None
+                self._finish_string(i, items)
+            elif ch < " ":
+                raise JSONStreamError("Control character in string", i)
+            return
+
+        if self._token == "scalar":
+            if ch in _SCALAR_CHARS:
+                return
+            self._token = None
+            self._finish_scalar(i, items)
+
+        if self._in_fence:
+            self._in_fence = ch != "\n"
+            return
+
+        if ch in _WHITESPACE:
+            return
+
+        if self._done:
+            if ch == "`":
+                return
+            raise JSONStreamError("Trailing data after JSON document", i)
+
+        if not self._started:
+            if ch == "`":
+                self._in_fence = True
+                return
+            if ch not in "{[":
+                raise JSONStreamError("Expected '{' or '['", i)
+
+        self._structural(ch, i, items)
+
+    def _structural(self, ch, i, items):
+        frame = self._stack[-1] if self._stack else None
+
+        if ch == "{" or ch == "[":
+            path = self._begin_value(frame, i)
+            self._stack.append(_Frame("object" if ch == "{" else "array", path))
+            self._started = True
+        elif ch == "}" or ch == "]":
+            kind = "object" if ch == "}" else "array"
+            if frame is None or frame.kind != kind or frame.state not in ("first", "after_value"):
+                raise JSONStreamError(f"Unexpected '{ch}'", i)
+            self._stack.pop()
+            self._end_value(i + 1, items)
+        elif frame is None:
+            raise JSONStreamError(f"Unexpected {ch!r}", i)
+        elif ch == ",":
+            if frame.state != "after_value":
+                raise JSONStreamError("Unexpected ','", i)
+            frame.state = "key" if frame.kind == "object" else "value"
+        elif ch == ":":
+            if frame.kind != "object" or frame.state != "colon":
+                raise JSONStreamError("Unexpected ':'", i)
+            frame.state = "value"
+        elif ch == '"':
+            if frame.kind == "object" and frame.state in ("first", "key"):
+                frame.state = "reading_key"
+            else:
+                self._begin_value(frame, i)
+            self._token = "string"
+            self._token_start = i
+        elif ch in _SCALAR_CHARS:
+            self._begin_value(frame, i)
+            self._token = "scalar"
+            self._token_start = i
+        else:
+            raise JSONStreamError(f"Unexpected character {ch!r}", i)
+
+    def _begin_value(self, frame, i):
+        if frame is None:
+            return ()
+        if frame.kind == "object":
+            if frame.state != "value":
+                raise JSONStreamError("Expected ':'" if frame.state == "colon" else "Expected an object key", i)
+            path = frame.path + (frame.key,)
+        else:
+            if frame.state not in ("first", "value"):
+                raise JSONStreamError("Expected ',' or ']'", i)
+            path = frame.path + (frame.index,)
+            if self._capture is None and frame.path == self.item_path:
+                self._capture = (len(self._stack), i)
+        frame.state = "in_value"
+        return path
+
+    def _end_value(self, end, items):
+        if not self._stack:
+            self._done = True
+            return
+        frame = self._stack[-1]
+        if frame.kind == "array":
+            frame.index += 1
+        frame.state = "after_value"
+        if self._capture is not None and self._capture[0] == len(self._stack):
+            items.append(json.loads(self._buffer[self._capture[1]:end]))
+            self._capture = None
+
+    def _finish_string(self, i, items):
+        frame = self._stack[-1]
+        if frame.state == "reading_key":
+            frame.key = json.loads(self._buffer[self._token_start:i + 1])
+            frame.state = "colon"
+        else:
+            self._end_value(i + 1, items)
+
+    def _finish_scalar(self, i, items):
+        raw = self._buffer[self._token_start:i]
+        try:
+            json.loads(raw)
+        except ValueError:
+            raise JSONStreamError(f"Invalid literal {raw!r}", self._token_start)
+        self._end_value(i, items)
@@ -0,0 +1,64 @@
+import json
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), default=str, ensure_ascii=False).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def compact(value):
+    # Validates once on write and returns the canonical compact text we store.
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value).decode("utf-8")
+    parsed = loads(value) if isinstance(value, str) else value
+    return dumps(parsed).decode("utf-8")
+
+
+def raw(value):
+    if value is None:
+        return b"null"
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    return dumps(value)
+
+
+def splice_object(fields=None, raw_fields=None):
+    parts = []
+    for key, value in (fields or {}).items():
+        parts.append(dumps(key) + b":" + dumps(value))
+    for key, value in (raw_fields or {}).items():
+        parts.append(dumps(key) + b":" + raw(value))
+    return b"{" + b",".join(parts) + b"}"
+
+
+def splice_array(items):
+    return b"[" + b",".join(raw(item) for item in items) + b"]"
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+class RawJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return raw(content)
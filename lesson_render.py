@@ -0,0 +1,44 @@
+import hashlib
+from profiler import timed_phase
+
+try:
+    import markdown
+    import nh3
+except ImportError:
+    markdown = None
+    nh3 = None
+
+# Bump when the rendering or sanitizing rules change so stored HTML is rebuilt on next read.
+RENDER_VERSION = "1"
+
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "sane_lists"]
+ALLOWED_TAGS = (nh3.ALLOWED_TAGS | {"pre", "code", "table", "thead", "tbody", "tr", "th", "td", "hr"}) if nh3 else set()
+
+
+def renderer_available():
+    return markdown is not None
+
+
+def content_hash(markdown_text):
+    digest = hashlib.sha256((markdown_text or "").encode("utf-8", "ignore")).hexdigest()[:32]
+    return f"{RENDER_VERSION}-{digest}" if renderer_available() else f"md-{digest}"
+
+
+def is_current(hash_value):
+    # Hashes made without a renderer (md-...) or by an older version need a re-render.
+    return bool(hash_value) and hash_value.startswith(f"{RENDER_VERSION}-" if renderer_available() else "md-")
+
+
+@timed_phase("render")
+def render_lesson(markdown_text):
+    # Returns sanitized HTML, or None when the optional renderer is not installed
+    # (the page then falls back to rendering the markdown itself).
+    if not renderer_available() or not markdown_text:
+        return None
+    raw_html = markdown.markdown(markdown_text, extensions=MARKDOWN_EXTENSIONS, output_format="html")
+    return nh3.clean(
+        raw_html,
+        tags=ALLOWED_TAGS,
+        link_rel="noopener noreferrer",
+        url_schemes={"http", "https", "mailto"},
+    )
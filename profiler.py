@@ -0,0 +1,259 @@
+import os
+import sys
+import time
+import itertools
+import threading
+import functools
+import contextvars
+from collections import deque
+from starlette.templating import Jinja2Templates
+from app_logging import get_logger, request_id_var
+
+# Requests slower than this keep their profile; 0 leaves only header-flagged requests profiled.
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 0))
+PROFILE_SAMPLE_MS = float(os.environ.get("PROFILE_SAMPLE_MS", 5))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 50))
+PROFILE_MAX_DEPTH = 128
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+log = get_logger("profiler")
+
+_current = contextvars.ContextVar("profile", default=None)
+_ids = itertools.count(1)
+profiles = deque(maxlen=PROFILE_KEEP)
+
+
+def is_admin(user):
+    return bool(user) and (user.get("email") or "").lower() in ADMIN_EMAILS
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profile:
+    def __init__(self, scope, reason):
+        self.id = next(_ids)
+        self.reason = reason
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.request_id = request_id_var.get()
+        self.started_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        self.start = time.perf_counter()
+        self.status = None
+        self.duration_ms = None
+        self.samples = 0
+        self.stacks = {}
+        self.phases = {}
+        # The event-loop thread is shared by every request, so its samples only count while
+        # this request's own coroutine (the anchor frame) is on the stack.
+        self.loop_thread = threading.get_ident()
+        self.anchor = None
+        self._threads = {}
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def enter(self, name):
+        tid = threading.get_ident()
+        with self._lock:
+            depth = self._open.get((tid, name), 0)
+            self._open[(tid, name)] = depth + 1
+            if tid != self.loop_thread:
+                self._threads[tid] = self._threads.get(tid, 0) + 1
+        # Only the outermost call of a phase on a thread is timed, so nested db calls count once.
+        return depth == 0
+
+    def leave(self, name, elapsed):
+        tid = threading.get_ident()
+        with self._lock:
+            depth = self._open.pop((tid, name)) - 1
+            if depth:
+                self._open[(tid, name)] = depth
+            else:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            if tid != self.loop_thread:
+                held = self._threads.pop(tid) - 1
+                if held:
+                    self._threads[tid] = held
+
+    def sample(self, frames):
+        with self._lock:
+            threads = list(self._threads)
+        self.samples += 1
+
+        frame = frames.get(self.loop_thread)
+        stack = []
+        while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+            stack.append(_label(frame.f_code))
+            if frame is self.anchor:
+                self._add("request", stack)
+                break
+            frame = frame.f_back
+
+        for tid in threads:
+            frame = frames.get(tid)
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self._add("worker", stack)
+
+    def _add(self, root, stack):
+        key = ";".join([root] + stack[::-1])
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def finish(self, status):
+        self.status = status
+        self.duration_ms = round((time.perf_counter() - self.start) * 1000, 1)
+
+    def summary(self):
+        phases = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+        # Phases timed on worker threads can run alongside each other and the event loop, so their
+        # sum may exceed the wall time; "other" is clamped at zero and is only a floor.
+        phases["other"] = round(max(0.0, self.duration_ms - sum(phases.values())), 1)
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+            "sample_ms": PROFILE_SAMPLE_MS,
+            "phases_ms": phases,
+        }
+
+    def collapsed(self):
+        # One "frame;frame;frame count" line per distinct stack: the input format of
+        # flamegraph.pl and speedscope.
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class _Sampler:
+    # A single daemon thread that wakes every PROFILE_SAMPLE_MS while any request is being
+    # profiled and records each profiled thread's current stack.
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def add(self, profile):
+        with self.lock:
+            self.active[profile.id] = profile
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self.thread.start()
+            self.wake.set()
+
+    def remove(self, profile):
+        with self.lock:
+            self.active.pop(profile.id, None)
+
+    def _run(self):
+        while True:
+            self.wake.wait()
+            with self.lock:
+                active = list(self.active.values())
+                if not active:
+                    self.wake.clear()
+                    continue
+            frames = sys._current_frames()
+            for profile in active:
+                try:
+                    profile.sample(frames)
+                except Exception:
+                    log.exception("Sampling failed for profile %s", profile.id)
+            del frames
+            time.sleep(self.interval)
+
+
+_sampler = _Sampler(PROFILE_SAMPLE_MS / 1000)
+
+
+def timed_phase(name):
+    # Adds the call's wall time to the current request's profile under `name`. Without an
+    # active profile this is one contextvar lookup.
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None or profile.duration_ms is not None:
+                return func(*args, **kwargs)
+            outermost = profile.enter(name)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.leave(name, time.perf_counter() - start if outermost else 0.0)
+        return wrapper
+    return decorate
+
+
+class ProfiledTemplates(Jinja2Templates):
+    @timed_phase("render")
+    def TemplateResponse(self, *args, **kwargs):
+        return super().TemplateResponse(*args, **kwargs)
+
+
+def get_profile(profile_id):
+    for profile in profiles:
+        if profile.id == profile_id:
+            return profile
+    return None
+
+
+class ProfilerMiddleware:
+    # Samples every request while PROFILE_SLOW_MS is set and keeps the slow ones; an admin can
+    # also flag a single request with "X-Profile: 1". Must run inside the session middleware.
+
+    def __init__(self, app, slow_ms=PROFILE_SLOW_MS):
+        self.app = app
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        flagged = dict(scope.get("headers") or []).get(b"x-profile") == b"1" and is_admin((scope.get("session") or {}).get("user"))
+        if not flagged and self.slow_ms <= 0:
+            return await self.app(scope, receive, send)
+
+        profile = Profile(scope, "header" if flagged else "slow")
+        profile.anchor = sys._getframe()
+        token = _current.set(profile)
+        _sampler.add(profile)
+        status = {"code": 500}
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if flagged:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", str(profile.id).encode())]
+            await send(message)
+            # Background tasks run after the last body chunk; they are not part of the latency.
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                self._finish(profile, status["code"])
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            self._finish(profile, status["code"])
+            _current.reset(token)
+
+    def _finish(self, profile, status):
+        if profile.duration_ms is not None:
+            return
+        _sampler.remove(profile)
+        profile.finish(status)
+        if profile.reason == "header" or profile.duration_ms >= self.slow_ms:
+            profiles.append(profile)
+            log.info(
+                "Profiled %s %s: %sms", profile.method, profile.path, profile.duration_ms,
+                extra={"profile_id": profile.id, "samples": profile.samples}
+            )
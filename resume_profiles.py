@@ -0,0 +1,47 @@
+import asyncio
+import json
+from starlette.concurrency import run_in_threadpool
+from json_util import loads
+from database import get_resume_for_profile, save_resume_profile, resume_text_hash
+from app_logging import get_logger
+
+log = get_logger("profiles")
+
+# resume_id -> task, so an upload followed by a quick activate extracts only once.
+_pending = {}
+
+
+def build_resume_profile(assistant, resume_id):
+    row = get_resume_for_profile(resume_id)
+    if not row or not (row["resume_text"] or "").strip():
+        return None
+
+    source_hash = row["text_hash"] or resume_text_hash(row["resume_text"])
+    if row["profile_json"] and row["profile_hash"] == source_hash:
+        return loads(row["profile_json"])
+
+    profile = json.loads(assistant.extract_resume_profile(row["resume_text"]))
+    if "error" in profile:
+        log.warning("Extraction failed for resume %s: %s", resume_id, profile['error'])
+        return None
+
+    save_resume_profile(resume_id, source_hash, profile)
+    log.info("Stored profile for resume %s", resume_id, extra={"resume_id": resume_id, "skills": len(profile.get('skills', []))})
+    return profile
+
+
+def _build_safely(assistant, resume_id):
+    try:
+        return build_resume_profile(assistant, resume_id)
+    except Exception:
+        log.exception("Error building profile for resume %s", resume_id)
+        return None
+
+
+async def ensure_resume_profile(assistant, resume_id):
+    task = _pending.get(resume_id)
+    if task is None:
+        task = asyncio.ensure_future(run_in_threadpool(_build_safely, assistant, resume_id))
+        _pending[resume_id] = task
+        task.add_done_callback(lambda _: _pending.pop(resume_id, None))
+    return await asyncio.shield(task)
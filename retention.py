@@ -0,0 +1,72 @@
+import os
+import time
+from datetime import datetime, timedelta
+from database import (
+    find_duplicate_notifications, merge_duplicate_notifications,
+    find_notifications_to_archive, archive_notifications, purge_archived_notifications
+)
+
+NOTIFY_MAX_PER_USER = int(os.environ.get("NOTIFY_MAX_PER_USER", 50))
+NOTIFY_TTL_DAYS = float(os.environ.get("NOTIFY_TTL_DAYS", 30))
+NOTIFY_READ_GRACE_HOURS = float(os.environ.get("NOTIFY_READ_GRACE_HOURS", 24))
+NOTIFY_ARCHIVE_TTL_DAYS = float(os.environ.get("NOTIFY_ARCHIVE_TTL_DAYS", 180))
+NOTIFY_RETENTION_INTERVAL = int(os.environ.get("NOTIFY_RETENTION_INTERVAL", 3600))
+NOTIFY_RETENTION_CHUNK = int(os.environ.get("NOTIFY_RETENTION_CHUNK", 500))
+NOTIFY_RETENTION_MAX_CHUNKS = int(os.environ.get("NOTIFY_RETENTION_MAX_CHUNKS", 20))
+
+# Pause between chunks so request handlers get the hot table in between.
+CHUNK_PAUSE = 0.05
+
+
+def _timestamp(delta):
+    return (datetime.utcnow() - delta).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _in_chunks(step):
+    # Calls step() until it reports a short chunk or the per-run chunk budget is spent.
+    total = chunks = 0
+    while chunks < NOTIFY_RETENTION_MAX_CHUNKS:
+        done, full = step()
+        total += done
+        chunks += 1
+        if not full:
+            break
+        time.sleep(CHUNK_PAUSE)
+    return total, chunks
+
+
+def run_retention():
+    def merge_step():
+        groups = find_duplicate_notifications(NOTIFY_RETENTION_CHUNK)
+        return merge_duplicate_notifications(groups), len(groups) == NOTIFY_RETENTION_CHUNK
+
+    read_before = _timestamp(timedelta(hours=NOTIFY_READ_GRACE_HOURS))
+    expire_before = _timestamp(timedelta(days=NOTIFY_TTL_DAYS))
+    archived_by = {}
+
+    def archive_step():
+        candidates = find_notifications_to_archive(read_before, expire_before, NOTIFY_MAX_PER_USER, NOTIFY_RETENTION_CHUNK)
+        moved = archive_notifications(candidates)
+        if moved:
+            for _, reason in candidates:
+                archived_by[reason] = archived_by.get(reason, 0) + 1
+        return moved, moved and len(candidates) == NOTIFY_RETENTION_CHUNK
+
+    purge_before = _timestamp(timedelta(days=NOTIFY_ARCHIVE_TTL_DAYS))
+
+    def purge_step():
+        purged = purge_archived_notifications(purge_before, NOTIFY_RETENTION_CHUNK)
+        return purged, purged == NOTIFY_RETENTION_CHUNK
+
+    merged, merge_chunks = _in_chunks(merge_step)
+    archived, archive_chunks = _in_chunks(archive_step)
+    purged, purge_chunks = _in_chunks(purge_step)
+
+    return {
+        "processed": merged + archived + purged,
+        "merged": merged,
+        "archived": archived,
+        "archived_by_reason": archived_by,
+        "purged": purged,
+        "chunks": merge_chunks + archive_chunks + purge_chunks,
+    }
@@ -0,0 +1,42 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+
+import database
+from json_util import loads
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    database.SQLITE_DB_NAME = str(tmp_path_factory.mktemp("db") / "users.db")
+    import app
+    app.init_db()
+    database.add_user("Export User", "export@example.com", "pw")
+    # Enough rows for several fetchmany() batches and several ~64KB response chunks.
+    database.add_notifications([
+        ("export@example.com", f"Role {i}", "Acme", 80, "x" * 200, "#") for i in range(1200)
+    ])
+    with TestClient(app.app) as client:
+        client.post("/auth/login", data={"email": "export@example.com", "password": "pw"}, follow_redirects=False)
+        yield client
+
+
+def test_ndjson_export_streams_to_the_end(client):
+    response = client.get("/api/export?format=ndjson")
+    assert response.status_code == 200
+
+    lines = [loads(line) for line in response.content.splitlines() if line.strip()]
+    assert lines[0]["user_email"] == "export@example.com"
+    tables = [line["table"] for line in lines[1:]]
+    assert tables.count("users") == 1
+    assert tables.count("notifications") == 1200
+
+
+def test_stream_query_resumes_on_another_thread(client):
+    # StreamingResponse resumes the generator on whichever threadpool thread is free.
+    rows = database.stream_query("SELECT id FROM notifications WHERE user_email = ?", ("export@example.com",), chunk_size=100)
+    first = next(rows)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        rest = pool.submit(list, rows).result()
+    assert len(rest) + 1 == 1200
+    assert first["id"] not in {row["id"] for row in rest}